@@ -0,0 +1,193 @@
+"""Drives the Welcome cog's listeners at high rates against in-memory stand-ins and reports how it holds up.
+
+Run from the repository root, for example:
+    python -m benchmarks.bench_welcome --guilds 10 --events 5000 --rate 2000 --delete --whisper both
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Any, Callable, Dict, List
+
+from .fakes import FakeGuild, FakeMember, MemoryDriver, install_memory_driver
+
+install_memory_driver()
+
+from welcome.welcome import Welcome  # noqa: E402 (must come after the driver is installed)
+
+EVENT_WEIGHTS = {"join": 0.55, "leave": 0.3, "ban": 0.1, "unban": 0.05}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Gets the pth percentile of values, which must be sorted."""
+
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class Instrumented:
+    """Wraps a Welcome cog to time every queued event from its listener call until its handler finishes."""
+
+    def __init__(self, cog: Welcome) -> None:
+        self.cog = cog
+        self.latencies: List[float] = []
+
+        # the cog keeps these private; the benchmark is the only thing that reaches in
+        original_enqueue: Callable[..., None] = cog._Welcome__enqueue
+
+        def enqueue(guild: Any, handler: Callable[..., Any], *args: Any) -> None:
+            queued_at = time.perf_counter()
+
+            async def timed(*a: Any) -> None:
+                await handler(*a)
+                self.latencies.append(time.perf_counter() - queued_at)
+
+            original_enqueue(guild, timed, *args)
+
+        cog._Welcome__enqueue = enqueue
+
+    async def drain(self) -> None:
+        """Waits until every held leave has been released, and every queued event and whisper has been handled."""
+
+        while True:
+            while self.cog._Welcome__held_leaves:
+                await asyncio.sleep(0.01)
+            queues = list(self.cog._Welcome__queues.values())
+            await asyncio.gather(*(q.join() for q in queues))
+            await self.cog._Welcome__whispers.join()
+            if not self.cog._Welcome__held_leaves and all(q.empty() for q in self.cog._Welcome__queues.values()):
+                return
+
+    def queue_depth(self) -> int:
+        """Gets the number of events currently waiting across all guilds."""
+
+        return sum(q.qsize() for q in self.cog._Welcome__queues.values())
+
+
+async def configure(cog: Welcome, guild: FakeGuild, args: argparse.Namespace) -> None:
+    """Applies the benchmark's settings to guild through Config, as the settings commands would."""
+
+    settings = cog.config.guild(guild)
+    await settings.enabled.set(True)
+    await settings.eventlog.set(args.eventlog)
+    for event in EVENT_WEIGHTS:
+        await settings.set_raw(event, "delete", value=args.delete)
+        await settings.set_raw(event, "messages", value=[args.format])
+        await settings.set_raw(event, "mirrors", value=[c.id for c in guild.text_channels[1 : 1 + args.mirrors]])
+    await settings.set_raw("join", "whisper", "state", value=args.whisper)
+    if args.digest:
+        await settings.set_raw("join", "digest", value={"enabled": True, "threshold": 5, "window": 1})
+
+
+async def fire(cog: Welcome, guild: FakeGuild, event: str, members: List[FakeMember], joined: List[FakeMember]) -> None:
+    """Calls the listener for event, as discord.py would."""
+
+    if event == "join" or not members:
+        member = FakeMember(guild, bot=random.random() < 0.02)
+        members.append(member)
+        joined.append(member)
+        await cog.on_member_join(member)
+    elif event == "leave":
+        await cog.on_member_remove(members.pop(random.randrange(len(members))))
+    elif event == "ban":
+        await cog.on_member_ban(guild, members.pop(random.randrange(len(members))))
+    else:
+        await cog.on_member_unban(guild, FakeMember(guild))
+
+
+async def run(args: argparse.Namespace) -> Dict[str, float]:
+    MemoryDriver.reset()
+    random.seed(args.seed)
+
+    guilds = [FakeGuild(channels=args.channels, latency=args.send_latency) for _ in range(args.guilds)]
+
+    setup_cog = Welcome()
+    for guild in guilds:
+        await configure(setup_cog, guild, args)
+
+    cog = Welcome()
+    cog.ban_leave_window = args.ban_window
+    await cog.cog_load()
+    # Config instances are shared per cog, so this is the same driver setup_cog used
+    driver: MemoryDriver = cog.config._driver
+    driver.reads = driver.writes = 0
+    instrumented = Instrumented(cog)
+
+    members: Dict[int, List[FakeMember]] = {g.id: [] for g in guilds}
+    joined: List[FakeMember] = []
+    events = random.choices(list(EVENT_WEIGHTS), weights=list(EVENT_WEIGHTS.values()), k=args.events)
+    interval = 1 / args.rate if args.rate else 0.0
+    max_depth = 0
+
+    started = time.perf_counter()
+    for n, event in enumerate(events):
+        guild = random.choice(guilds)
+        await fire(cog, guild, event, members[guild.id], joined)
+        max_depth = max(max_depth, instrumented.queue_depth())
+
+        if interval:
+            delay = started + (n + 1) * interval - time.perf_counter()
+            await asyncio.sleep(max(delay, 0))
+        elif n % 100 == 0:
+            # let the workers run between batches, as the gateway would
+            await asyncio.sleep(0)
+
+    if args.digest:
+        await asyncio.sleep(1.1)
+    await instrumented.drain()
+    elapsed = time.perf_counter() - started
+
+    await cog.cog_unload()
+
+    latencies = sorted(instrumented.latencies)
+    sends = sum(g.sends for g in guilds)
+    deletes = sum(g.deletes for g in guilds)
+    dms = sum(m.dms for m in joined)
+
+    return {
+        "events": len(events),
+        "events/sec": len(events) / elapsed,
+        "p50 latency (ms)": percentile(latencies, 0.50) * 1000,
+        "p99 latency (ms)": percentile(latencies, 0.99) * 1000,
+        "max queue depth": max_depth,
+        "config reads/event": driver.reads / len(events),
+        "config writes/event": driver.writes / len(events),
+        "channel sends/event": sends / len(events),
+        "deletes/event": deletes / len(events),
+        "DMs/event": dms / len(events),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--guilds", type=int, default=5, help="number of guilds to spread events over")
+    parser.add_argument("--channels", type=int, default=50, help="text channels per guild")
+    parser.add_argument("--events", type=int, default=2000, help="number of events to fire")
+    parser.add_argument("--rate", type=float, default=0, help="events per second to fire; 0 fires as fast as possible")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="seconds each channel send takes")
+    parser.add_argument("--mirrors", type=int, default=0, help="extra channels each notice is mirrored to")
+    parser.add_argument("--delete", action="store_true", help="turn on deletion of previous notices")
+    parser.add_argument("--digest", action="store_true", help="turn on join digests")
+    parser.add_argument("--eventlog", action="store_true", help="turn on the membership event log")
+    parser.add_argument("--whisper", choices=["off", "only", "both", "fall"], default="off", help="join whisper type")
+    parser.add_argument("--format", default="Welcome {member.mention} to {server.name}! #{count}", help="notice format")
+    parser.add_argument(
+        "--ban-window",
+        type=float,
+        default=0.05,
+        help=f"seconds each leave is held back in case it is a ban (the cog waits {Welcome.ban_leave_window:g})",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed, for repeatable runs")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    width = max(len(k) for k in results)
+    for key, value in results.items():
+        print(f"{key:<{width}}  {value:,.2f}" if isinstance(value, float) else f"{key:<{width}}  {value:,}")
+
+
+if __name__ == "__main__":
+    main()
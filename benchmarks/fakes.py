@@ -0,0 +1,216 @@
+"""Lightweight stand-ins for Red's Config storage and discord.py models, for driving cogs without Discord."""
+
+import asyncio
+import datetime
+import itertools
+import json
+import tempfile
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import discord
+from redbot.core import config, data_manager
+from redbot.core._drivers.base import BaseDriver, IdentifierData
+
+_snowflakes = itertools.count(10**17)
+
+
+def next_id() -> int:
+    """Gets a new unique ID."""
+
+    return next(_snowflakes)
+
+
+class MemoryDriver(BaseDriver):
+    """A Config driver which keeps everything in memory and counts every operation."""
+
+    data: Dict[str, Any] = {}
+    drivers: List["MemoryDriver"] = []
+
+    def __init__(self, cog_name: str, identifier: str, **kwargs) -> None:
+        super().__init__(cog_name, identifier, **kwargs)
+
+        self.reads = 0
+        self.writes = 0
+        MemoryDriver.drivers.append(self)
+
+    @classmethod
+    async def initialize(cls, **storage_details) -> None:
+        pass
+
+    @classmethod
+    async def teardown(cls) -> None:
+        pass
+
+    @staticmethod
+    def get_config_details() -> Dict[str, Any]:
+        return {}
+
+    @classmethod
+    async def aiter_cogs(cls) -> AsyncIterator[Tuple[str, str]]:
+        for cog_name, cog_data in cls.data.items():
+            for identifier in cog_data:
+                yield cog_name, identifier
+
+    async def get(self, identifier_data: IdentifierData) -> Any:
+        self.reads += 1
+
+        partial = self.data.setdefault(self.cog_name, {})
+        for i in identifier_data.to_tuple()[1:]:
+            partial = partial[i]
+
+        # a real driver never hands out its own objects
+        return json.loads(json.dumps(partial))
+
+    async def set(self, identifier_data: IdentifierData, value: Any = None) -> None:
+        self.writes += 1
+
+        partial = self.data.setdefault(self.cog_name, {})
+        identifiers = identifier_data.to_tuple()[1:]
+        for i in identifiers[:-1]:
+            partial = partial.setdefault(i, {})
+        partial[identifiers[-1]] = json.loads(json.dumps(value))
+
+    async def clear(self, identifier_data: IdentifierData) -> None:
+        self.writes += 1
+
+        partial = self.data.setdefault(self.cog_name, {})
+        identifiers = identifier_data.to_tuple()[1:]
+        try:
+            for i in identifiers[:-1]:
+                partial = partial[i]
+            del partial[identifiers[-1]]
+        except KeyError:
+            pass
+
+    @classmethod
+    def reset(cls) -> None:
+        """Forgets all stored data and drivers."""
+
+        cls.data = {}
+        cls.drivers = []
+
+
+def install_memory_driver() -> None:
+    """Makes every Config created from now on use a MemoryDriver, and points cog data paths at a temporary directory."""
+
+    config.get_driver = lambda cog_name, identifier, **kwargs: MemoryDriver(cog_name, identifier)
+
+    if data_manager.basic_config is None:
+        data_manager.basic_config = {
+            "DATA_PATH": tempfile.mkdtemp(prefix="tmerc-bench-"),
+            "COG_PATH_APPEND": "cogs",
+            "CORE_PATH_APPEND": "core",
+        }
+
+
+class FakePermissions:
+    def __init__(self, *, send_messages: bool = True, manage_messages: bool = True) -> None:
+        self.send_messages = send_messages
+        self.manage_messages = manage_messages
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeTextChannel", content: Optional[str] = None) -> None:
+        self.id = next_id()
+        self.channel = channel
+        self.content = content
+        self.created_at = discord.utils.utcnow()
+
+    async def delete(self) -> None:
+        self.channel.deletes += 1
+
+
+class FakeTextChannel:
+    def __init__(self, guild: "FakeGuild", name: str, *, latency: float = 0.0) -> None:
+        self.id = next_id()
+        self.guild = guild
+        self.name = name
+        self.mention = f"<#{self.id}>"
+        self.latency = latency
+
+        self.sends = 0
+        self.deletes = 0
+        self.bulk_deletes = 0
+        self.fetches = 0
+
+    def __str__(self) -> str:
+        return self.name
+
+    def permissions_for(self, _) -> FakePermissions:
+        return FakePermissions()
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        message = FakeMessage(self)
+        message.id = message_id
+        return message
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.sends += 1
+        return FakeMessage(self, content)
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        self.fetches += 1
+        return self.get_partial_message(message_id)
+
+    async def delete_messages(self, messages: List[FakeMessage], **kwargs) -> None:
+        self.bulk_deletes += 1
+
+
+class FakeRole:
+    def __init__(self, name: str, *, position: int = 0) -> None:
+        self.id = next_id()
+        self.name = name
+        self.position = position
+        self.mention = f"<@&{self.id}>"
+
+    def is_default(self) -> bool:
+        return self.name == "@everyone"
+
+
+class FakeGuild:
+    def __init__(self, *, channels: int = 1, latency: float = 0.0) -> None:
+        self.id = next_id()
+        self.name = f"Guild {self.id}"
+        self.description = None
+        self.created_at = discord.utils.utcnow()
+        self.me = object()
+        self.system_channel = None
+        self.text_channels = [FakeTextChannel(self, f"channel-{i}", latency=latency) for i in range(channels)]
+        self.default_role = FakeRole("@everyone")
+
+    def get_channel(self, channel_id: Optional[int]) -> Optional[FakeTextChannel]:
+        return next((c for c in self.text_channels if c.id == channel_id), None)
+
+    @property
+    def sends(self) -> int:
+        return sum(c.sends for c in self.text_channels)
+
+    @property
+    def deletes(self) -> int:
+        return sum(c.deletes + c.bulk_deletes for c in self.text_channels)
+
+
+class FakeMember:
+    def __init__(self, guild: FakeGuild, *, bot: bool = False, created_at: Optional[datetime.datetime] = None) -> None:
+        self.id = next_id()
+        self.guild = guild
+        self.bot = bot
+        self.name = self.display_name = f"member{self.id}"
+        self.nick = None
+        self.mention = f"<@{self.id}>"
+        self.discriminator = "0"
+        self.color = self.colour = discord.Colour.default()
+        self.created_at = created_at or discord.utils.utcnow()
+        self.joined_at = discord.utils.utcnow()
+        self.roles = [guild.default_role]
+
+        self.dms = 0
+
+    def __str__(self) -> str:
+        return self.name
+
+    async def send(self, content: Optional[str] = None, **kwargs) -> FakeMessage:
+        self.dms += 1
+        return FakeMessage(None, content)
@@ -0,0 +1,169 @@
+"""Replays a trace recorded with `[p]welcomeset trace start` against the Welcome cog and in-memory stand-ins.
+
+Run from the repository root, for example:
+    python -m benchmarks.replay_welcome raid.jsonl --speed 10 --delete --whisper both
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+import discord
+
+from .bench_welcome import Instrumented, configure, percentile
+from .fakes import FakeGuild, FakeMember, MemoryDriver, install_memory_driver
+
+install_memory_driver()
+
+from welcome.welcome import Welcome  # noqa: E402 (must come after the driver is installed)
+
+
+def load(path: str) -> List[Dict[str, Any]]:
+    """Reads the events in a trace file, in the order they happened."""
+
+    with open(path, encoding="utf-8") as f:
+        events = [json.loads(line) for line in f if line.strip()]
+    return sorted(events, key=lambda e: e["t"])
+
+
+async def fire(
+    cog: Welcome, guild: FakeGuild, event: Dict[str, Any], members: Dict[Tuple[int, int], FakeMember]
+) -> FakeMember:
+    """Calls the listener for a recorded event, using the same stand-in member for the same recorded user."""
+
+    key = (event["guild"], event["user"])
+    member = members.get(key)
+    if member is None:
+        created_at = discord.utils.utcnow() - datetime.timedelta(seconds=event["age"])
+        member = members[key] = FakeMember(guild, bot=event["bot"], created_at=created_at)
+
+    if event["event"] == "join":
+        await cog.on_member_join(member)
+    elif event["event"] == "leave":
+        await cog.on_member_remove(member)
+    elif event["event"] == "ban":
+        await cog.on_member_ban(guild, member)
+    else:
+        await cog.on_member_unban(guild, member)
+
+    return member
+
+
+async def sample_depths(instrumented: Instrumented, depths: List[int], whisper_depths: List[int]) -> None:
+    """Records the event and whisper queue depths every 10 ms until cancelled."""
+
+    while True:
+        depths.append(instrumented.queue_depth())
+        whisper_depths.append(instrumented.cog._Welcome__whispers.qsize())
+        await asyncio.sleep(0.01)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, float]:
+    MemoryDriver.reset()
+
+    events = load(args.trace)
+    if not events:
+        raise SystemExit(f"{args.trace} holds no events")
+
+    guilds = {
+        n: FakeGuild(channels=args.channels, latency=args.send_latency) for n in sorted({e["guild"] for e in events})
+    }
+
+    setup_cog = Welcome()
+    for guild in guilds.values():
+        await configure(setup_cog, guild, args)
+
+    cog = Welcome()
+    if args.ban_window is not None:
+        cog.ban_leave_window = args.ban_window
+    await cog.cog_load()
+    instrumented = Instrumented(cog)
+
+    members: Dict[Tuple[int, int], FakeMember] = {}
+    depths: List[int] = []
+    whisper_depths: List[int] = []
+    sampler = asyncio.create_task(sample_depths(instrumented, depths, whisper_depths))
+
+    speed = 0.0 if args.speed == "max" else float(args.speed.rstrip("x"))
+    first = events[0]["t"]
+
+    started = time.perf_counter()
+    for n, event in enumerate(events):
+        if speed:
+            delay = started + (event["t"] - first) / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif n % 100 == 0:
+            # let the workers run between batches, as the gateway would
+            await asyncio.sleep(0)
+
+        await fire(cog, guilds[event["guild"]], event, members)
+
+    if args.digest:
+        await asyncio.sleep(1.1)
+    await instrumented.drain()
+    elapsed = time.perf_counter() - started
+
+    sampler.cancel()
+    await cog.cog_unload()
+
+    latencies = sorted(instrumented.latencies)
+    dropped = sum(cog._Welcome__queue_dropped.values())
+
+    return {
+        "events": len(events),
+        "trace length (s)": events[-1]["t"] - first,
+        "replay length (s)": elapsed,
+        "dropped events": dropped,
+        f"late notices (> {args.late:g} s)": sum(1 for latency in latencies if latency > args.late),
+        "p50 latency (ms)": percentile(latencies, 0.50) * 1000,
+        "p99 latency (ms)": percentile(latencies, 0.99) * 1000,
+        "max latency (ms)": (latencies[-1] if latencies else 0.0) * 1000,
+        "max queue depth": max(depths, default=0),
+        "mean queue depth": sum(depths) / len(depths) if depths else 0.0,
+        "max whisper queue depth": max(whisper_depths, default=0),
+        "channel sends": sum(g.sends for g in guilds.values()),
+        "deletes": sum(g.deletes for g in guilds.values()),
+        "DMs": sum(m.dms for m in members.values()),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("trace", help="trace file to replay")
+    parser.add_argument("--speed", default="1x", help="how fast to replay: 1x, 10x, any other multiple, or max")
+    parser.add_argument("--late", type=float, default=5.0, help="seconds after which a notice counts as late")
+    parser.add_argument("--channels", type=int, default=50, help="text channels per guild")
+    parser.add_argument("--send-latency", type=float, default=0.0, help="seconds each channel send takes")
+    parser.add_argument("--mirrors", type=int, default=0, help="extra channels each notice is mirrored to")
+    parser.add_argument("--delete", action="store_true", help="turn on deletion of previous notices")
+    parser.add_argument("--digest", action="store_true", help="turn on join digests")
+    parser.add_argument("--eventlog", action="store_true", help="turn on the membership event log")
+    parser.add_argument(
+        "--ban-window",
+        type=float,
+        help=f"seconds each leave is held back in case it is a ban (default {Welcome.ban_leave_window:g}, as the cog)",
+    )
+    parser.add_argument("--whisper", choices=["off", "only", "both", "fall"], default="off", help="join whisper type")
+    parser.add_argument("--format", default="Welcome {member.mention} to {server.name}! #{count}", help="notice format")
+    args = parser.parse_args()
+
+    if args.speed != "max":
+        try:
+            if float(args.speed.rstrip("x")) <= 0:
+                raise ValueError
+        except ValueError:
+            parser.error("--speed must be a positive multiple such as 1x or 10x, or max")
+
+    results = asyncio.run(run(args))
+
+    width = max(len(k) for k in results)
+    for key, value in results.items():
+        print(f"{key:<{width}}  {value:,.2f}" if isinstance(value, float) else f"{key:<{width}}  {value:,}")
+
+
+if __name__ == "__main__":
+    main()
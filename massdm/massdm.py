@@ -40,15 +40,19 @@ class MassDM(commands.Cog):
         except discord.DiscordException:
             log.warning("Failed to delete command message")
 
+        safe_role = SafeRole(role)
+        safe_guild = SafeGuild(ctx.guild)
+        sender = SafeMember(ctx.author)
+
         for member in [m for m in role.members if not m.bot]:
             try:
                 await member.send(
                     message.format(
                         member=SafeMember(member),
-                        role=SafeRole(role),
-                        server=SafeGuild(ctx.guild),
-                        guild=SafeGuild(ctx.guild),
-                        sender=SafeMember(ctx.author),
+                        role=safe_role,
+                        server=safe_guild,
+                        guild=safe_guild,
+                        sender=sender,
                     )
                 )
             except discord.Forbidden:
@@ -57,3 +61,27 @@ class MassDM(commands.Cog):
             except discord.DiscordException:
                 log.warning(f"Failed to DM user {member} (ID {member.id})")
                 continue
+
+    @commands.Cog.listener()
+    async def on_guild_update(self, _, after: discord.Guild) -> None:
+        """Listens for server updates to refresh the server's safe model."""
+
+        SafeGuild.forget(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """Listens for the bot leaving a server to drop the server's safe model."""
+
+        SafeGuild.forget(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, _, after: discord.Role) -> None:
+        """Listens for role updates to refresh the role's safe model."""
+
+        SafeRole.forget(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        """Listens for role deletions to drop the role's safe model."""
+
+        SafeRole.forget(role.id)
@@ -4,4 +4,4 @@ from .streamrole import StreamRole
 
 
 async def setup(bot: Red):
-    await bot.add_cog(StreamRole())
+    await bot.add_cog(StreamRole(bot))
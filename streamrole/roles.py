@@ -0,0 +1,23 @@
+from typing import Any, Dict, Optional
+
+import discord
+
+
+class GuildRoles:
+    """A guild's streaming role and promotion rules, resolved once and kept until its roles or settings change."""
+
+    __slots__ = ("streaming", "promote_from_id", "lax_position")
+
+    def __init__(self, guild: discord.Guild, config: Dict[str, Any]) -> None:
+        self.streaming: Optional[discord.Role] = guild.get_role(config["role"]) if config["role"] is not None else None
+
+        # the prerequisite role's ID, or None if anyone may be promoted
+        self.promote_from_id: Optional[int] = config["promote_from"] if config["promote"] else None
+
+        # with lax promotion, having the prerequisite role or any above it is the same as having a top role at least
+        # as high as it, so a single comparison will do
+        self.lax_position: Optional[int] = None
+        if self.promote_from_id is not None and config["lax_promote"]:
+            promote_from = guild.get_role(self.promote_from_id)
+            if promote_from is not None:
+                self.lax_position = promote_from.position
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Optional, Tuple
+
+import aiohttp
+import discord
+
+log = logging.getLogger("red.tmerc.streamrole")
+
+# (member, role, whether to add it, future for the outcome, attempts so far)
+Edit = Tuple[discord.Member, discord.Role, bool, asyncio.Future, int]
+EditFunc = Callable[[discord.Member, discord.Role, bool], Awaitable[None]]
+
+
+class RoleEditScheduler:
+    """Makes one guild's role edits, one at a time, paced by a token bucket so as to stay under Discord's rate limits.
+
+    Removals go before additions, so that nobody keeps a role for longer than they should when edits back up. Edits
+    which hit a rate limit or a transient error are retried with exponential backoff, which also holds back every
+    other edit for the guild, since they share Discord's limit. At most max_queued edits wait at once.
+    """
+
+    __slots__ = (
+        "guild_id",
+        "rate",
+        "burst",
+        "max_queued",
+        "max_attempts",
+        "dropped",
+        "retries",
+        "_edit",
+        "_on_idle",
+        "_removals",
+        "_additions",
+        "_tokens",
+        "_refilled",
+        "_dropped_since_idle",
+        "_wakeup",
+        "_task",
+    )
+
+    def __init__(
+        self,
+        guild_id: int,
+        edit: EditFunc,
+        on_idle: Callable[[int], None],
+        *,
+        rate: float,
+        burst: int,
+        max_queued: int,
+        max_attempts: int,
+    ) -> None:
+        self.guild_id = guild_id
+        self.rate = rate
+        self.burst = burst
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        # edits turned away because the queue was full, and edits retried, since the scheduler was made
+        self.dropped = 0
+        self.retries = 0
+
+        # makes the edit, raising if it fails; and is called with the number of edits dropped since the queue was last
+        # empty, whenever it empties having dropped some
+        self._edit = edit
+        self._on_idle = on_idle
+
+        self._removals: Deque[Edit] = deque()
+        self._additions: Deque[Edit] = deque()
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._dropped_since_idle = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._removals) + len(self._additions)
+
+    @property
+    def queued_removals(self) -> int:
+        """How many of the waiting edits are removals."""
+
+        return len(self._removals)
+
+    def submit(self, member: discord.Member, role: discord.Role, add: bool) -> asyncio.Future:
+        """Queues an edit, starting the worker if needed.
+
+        Returns a future which is done once the edit has been made, and holds the error if it could not be. Raises
+        asyncio.QueueFull if max_queued edits are already waiting, unless this is a removal and some of those are
+        additions, in which case the newest addition is dropped to make room.
+        """
+
+        if len(self) >= self.max_queued:
+            self.dropped += 1
+            self._dropped_since_idle += 1
+            if add or not self._additions:
+                raise asyncio.QueueFull
+
+            evicted = self._additions.pop()[3]
+            if not evicted.done():
+                evicted.set_exception(asyncio.QueueFull())
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.__work())
+
+        future = asyncio.get_running_loop().create_future()
+        (self._additions if add else self._removals).append((member, role, add, future, 0))
+        self._wakeup.set()
+        return future
+
+    def close(self) -> None:
+        """Stops the worker and cancels every waiting edit."""
+
+        if self._task is not None:
+            self._task.cancel()
+
+        for _, _, _, future, _ in (*self._removals, *self._additions):
+            future.cancel()
+
+        self._removals.clear()
+        self._additions.clear()
+
+    async def __work(self) -> None:
+        """Makes the queued edits, highest priority first, forever."""
+
+        while True:
+            try:
+                await self.__work_once()
+            except Exception:
+                # one bad edit mustn't stop every other edit for the guild
+                log.exception(f"Unexpected error in role edit worker (server ID {self.guild_id})")
+
+    async def __work_once(self) -> None:
+        """Waits for an edit and makes it, waiting out a backoff after it if it is to be retried."""
+
+        if not self:
+            if self._dropped_since_idle:
+                dropped, self._dropped_since_idle = self._dropped_since_idle, 0
+                self._on_idle(dropped)
+
+            self._wakeup.clear()
+            await self._wakeup.wait()
+            return
+
+        await asyncio.sleep(self.__take_token())
+
+        lane = self._removals or self._additions
+        member, role, add, future, attempts = lane.popleft()
+        if future.done():
+            # whoever was waiting on it has given up
+            return
+
+        try:
+            await self._edit(member, role, add)
+        except Exception as e:
+            delay = RoleEditScheduler.__retry_delay(e, attempts)
+            if delay is None or attempts + 1 >= self.max_attempts:
+                # the waiter may have given up while the edit was being made
+                if not future.done():
+                    future.set_exception(e)
+                return
+
+            log.info(
+                f"Retrying role edit for member ID {member.id} (server ID {self.guild_id}) in {delay:.1f} seconds "
+                f"after {type(e).__name__}"
+            )
+            self.retries += 1
+            # back to the front of its lane, so it keeps its place ahead of anything queued since
+            lane.appendleft((member, role, add, future, attempts + 1))
+            await asyncio.sleep(delay)
+        else:
+            if not future.done():
+                future.set_result(None)
+
+    def __take_token(self) -> float:
+        """Takes a token from the bucket, and gets how many seconds to wait before using it."""
+
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    @staticmethod
+    def __retry_delay(error: Exception, attempts: int) -> Optional[float]:
+        """Gets how many seconds to wait before retrying an edit which failed with error, or None if it shouldn't be.
+
+        Rate limits and server errors are worth retrying, as are timeouts and dropped connections; anything else, such
+        as missing permissions or a member who has left, will fail the same way again.
+        """
+
+        backoff = min(60.0, 2.0**attempts) * random.uniform(0.5, 1.0)
+
+        if isinstance(error, discord.RateLimited):
+            return max(error.retry_after, backoff)
+
+        if isinstance(error, discord.HTTPException):
+            return backoff if error.status == 429 or error.status >= 500 else None
+
+        if isinstance(error, (asyncio.TimeoutError, aiohttp.ClientError, OSError)):
+            return backoff
+
+        return None
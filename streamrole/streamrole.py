@@ -1,9 +1,18 @@
+import asyncio
+import copy
 import logging
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 import discord
 from redbot.core import Config, checks, commands
+from redbot.core.bot import Red
 from redbot.core.utils.chat_formatting import box
 
+from .roles import GuildRoles
+from .scheduler import RoleEditScheduler
+from .sweep import SweepProgress
+
 __author__ = "tmerc"
 
 log = logging.getLogger("red.tmerc.streamrole")
@@ -18,14 +27,81 @@ class StreamRole(commands.Cog):
         "promote": False,
         "promote_from": None,
         "lax_promote": False,
+        "hysteresis": 30,
     }
 
-    def __init__(self, *args, **kwargs) -> None:
+    # settings which change who should have the streaming role
+    role_settings = ("enabled", "role", "promote", "promote_from", "lax_promote")
+
+    # members checked between yields to the event loop, and the pace of role edits, during a sweep
+    sweep_chunk_size = 500
+    sweep_edits_per_second = 2.0
+
+    # pace of each guild's role edits, kept to about what Discord allows, and how many may wait
+    edit_rate = 1.0
+    edit_burst = 10
+    edit_queue_size = 1000
+    # attempts at each role edit before giving up on rate limits and transient errors
+    edit_attempts = 5
+
+    def __init__(self, bot: Red, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
+        self.bot = bot
         self.config = Config.get_conf(self, 34507445)
         self.config.register_guild(**self.guild_defaults)
 
+        # guild ID -> settings, kept in sync with Config by __set so presence updates never read Config
+        self.__cache: Dict[int, Dict[str, Any]] = {}
+        # IDs of guilds which are enabled and have a streaming role; every other guild's presence updates are ignored
+        self.__enabled: Set[int] = set()
+        # guild ID -> resolved roles; dropped whenever the guild's roles or settings change
+        self.__roles: Dict[int, GuildRoles] = {}
+
+        # guild ID -> reconciliation sweep in progress, and how far the latest sweep has got
+        self.__sweep_tasks: Dict[int, asyncio.Task] = {}
+        self.__sweeps: Dict[int, SweepProgress] = {}
+        self.__startup_task: Optional[asyncio.Task] = None
+
+        # (guild ID, member ID) -> timer for a role edit held back by the hysteresis window
+        self.__pending_edits: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+        # (guild ID, member ID) -> monotonic time the hysteresis window after the member's last role edit ends, in the
+        # order the edits were made; entries are dropped by __note_edit once their window has passed
+        self.__quiet_until: Dict[Tuple[int, int], float] = {}
+        # held back role edits which are being applied; kept here so they aren't garbage collected part way through
+        self.__edit_tasks: Set[asyncio.Task] = set()
+
+        # (guild ID, member ID) -> whether the member will have the streaming role once their role edit in flight lands
+        self.__in_flight: Dict[Tuple[int, int], bool] = {}
+        # (guild ID, member ID) -> the latest member and streaming state seen while their role edit was in flight
+        self.__latest: Dict[Tuple[int, int], Tuple[discord.Member, bool]] = {}
+        # guild ID -> the scheduler which makes that guild's role edits
+        self.__schedulers: Dict[int, RoleEditScheduler] = {}
+
+    async def cog_load(self) -> None:
+        """Loads the settings of every guild into memory, then sweeps the enabled guilds once the bot is ready."""
+
+        for guild_id, data in (await self.config.all_guilds()).items():
+            self.__cache[guild_id] = data
+            self.__refresh_enabled(guild_id)
+
+        self.__startup_task = asyncio.create_task(self.__sweep_on_load())
+
+    async def cog_unload(self) -> None:
+        """Stops any sweeps in progress and drops any held back or queued role edits."""
+
+        if self.__startup_task is not None:
+            self.__startup_task.cancel()
+
+        for task in self.__sweep_tasks.values():
+            task.cancel()
+
+        for timer in self.__pending_edits.values():
+            timer.cancel()
+
+        for scheduler in self.__schedulers.values():
+            scheduler.close()
+
     @commands.hybrid_group(aliases=["streamroleset"], fallback="state")
     @commands.guild_only()
     @checks.admin_or_permissions(manage_guild=True)
@@ -36,7 +112,7 @@ class StreamRole(commands.Cog):
 
         if ctx.invoked_subcommand is None:
             guild: discord.Guild = ctx.guild
-            config = await self.config.guild(guild).all()
+            config = self.__settings(guild)
             enabled = config["enabled"]
             role = config["role"]
             if role is not None:
@@ -46,6 +122,16 @@ class StreamRole(commands.Cog):
             if promote_from is not None:
                 promote_from: discord.Role = discord.utils.get(ctx.guild.roles, id=promote_from)
             lax_promote = config["lax_promote"]
+            hysteresis = config["hysteresis"]
+
+            scheduler = self.__schedulers.get(guild.id)
+            if scheduler is not None:
+                edits = (
+                    f"{len(scheduler)} / {self.edit_queue_size} queued ({scheduler.queued_removals} removals), "
+                    f"{scheduler.dropped} dropped, {scheduler.retries} retried"
+                )
+            else:
+                edits = f"0 / {self.edit_queue_size} queued"
 
             if await ctx.embed_requested():
                 emb = discord.Embed(color=await ctx.embed_color(), title="Current StreamRole Settings")
@@ -54,6 +140,8 @@ class StreamRole(commands.Cog):
                 emb.add_field(name="Only Promote Members With Prerequisite Role", value=promote)
                 emb.add_field(name="Promotion Prerequisite Role", value=(promote_from and promote_from.name))
                 emb.add_field(name="Promote from Prerequisite and Above", value=lax_promote)
+                emb.add_field(name="Hysteresis", value=f"{hysteresis} seconds")
+                emb.add_field(name="Role Edits", value=edits)
 
                 await ctx.send(embed=emb)
             else:
@@ -62,7 +150,9 @@ class StreamRole(commands.Cog):
                     f"  Streaming role: {role and role.name}\n"
                     f"  Only promote members with prerequisite role: {promote}\n"
                     f"  Promotion prerequisite role: {promote_from and promote_from.name}\n"
-                    f"  Promote from prerequisite and above: {lax_promote}",
+                    f"  Promote from prerequisite and above: {lax_promote}\n"
+                    f"  Hysteresis: {hysteresis} seconds\n"
+                    f"  Role edits: {edits}",
                     "Current StreamRole Settings",
                 )
 
@@ -78,16 +168,16 @@ class StreamRole(commands.Cog):
         await ctx.typing()
 
         guild: discord.Guild = ctx.guild
-        target_state = on_off if on_off is not None else not (await self.config.guild(guild).enabled())
+        target_state = on_off if on_off is not None else not self.__settings(guild)["enabled"]
 
-        streaming_role = await self.config.guild(guild).role()
+        streaming_role = self.__settings(guild)["role"]
         if streaming_role is None and target_state:
             await ctx.send(
                 f"You need to set a role with `{ctx.prefix}streamroleset role` before you can enable StreamRole."
             )
             return
 
-        await self.config.guild(guild).enabled.set(target_state)
+        await self.__set(guild, "enabled", target_state)
 
         if target_state:
             await ctx.send("StreamRole is now enabled.")
@@ -98,7 +188,7 @@ class StreamRole(commands.Cog):
     async def streamrole_role(self, ctx: commands.Context, *, role: discord.Role) -> None:
         """Sets the role which will be assigned to members who are streaming."""
 
-        await self.config.guild(ctx.guild).role.set(role.id)
+        await self.__set(ctx.guild, "role", role.id)
 
         await ctx.send(
             f"Done. Members who are streaming will now be given the role `{role.name}`. "
@@ -119,9 +209,9 @@ class StreamRole(commands.Cog):
         """
 
         guild: discord.Guild = ctx.guild
-        target_state = on_off if on_off is not None else not (await self.config.guild(guild).promote())
+        target_state = on_off if on_off is not None else not self.__settings(guild)["promote"]
 
-        prereq_role = await self.config.guild(guild).promote_from()
+        prereq_role = self.__settings(guild)["promote_from"]
         if prereq_role is None and target_state:
             await ctx.send(
                 f"You need to set a role with `{ctx.prefix}streamroleset promote role` before you can enable "
@@ -130,7 +220,7 @@ class StreamRole(commands.Cog):
             return
         prereq_role: discord.Role = discord.utils.get(guild.roles, id=prereq_role)
 
-        await self.config.guild(guild).promote.set(target_state)
+        await self.__set(guild, "promote", target_state)
 
         if target_state:
             await ctx.send(
@@ -150,7 +240,7 @@ class StreamRole(commands.Cog):
         If this role is set and promote is toggled on, only members with this role will be given the streaming role.
         """
 
-        await self.config.guild(ctx.guild).promote_from.set(role.id)
+        await self.__set(ctx.guild, "promote_from", role.id)
 
         await ctx.send(f"Done. Only members with the role `{role.name}` will be given the streaming role.")
 
@@ -165,9 +255,9 @@ class StreamRole(commands.Cog):
         """
 
         guild: discord.Guild = ctx.guild
-        target_state = on_off if on_off is not None else not (await self.config.guild(guild).lax_promote())
+        target_state = on_off if on_off is not None else not self.__settings(guild)["lax_promote"]
 
-        await self.config.guild(guild).lax_promote.set(target_state)
+        await self.__set(guild, "lax_promote", target_state)
 
         if target_state:
             await ctx.send(
@@ -180,73 +270,400 @@ class StreamRole(commands.Cog):
                 "prerequisite role will be given the streaming role."
             )
 
+    @streamrole.command(name="hysteresis")
+    async def streamrole_hysteresis(self, ctx: commands.Context, seconds: int) -> None:
+        """Sets how long to wait before taking the streaming role away, in seconds.
+
+        A member whose stream drops and comes back within this time keeps the role throughout, and no member's role
+        is edited more than once in this time. 0 turns this off.
+        """
+
+        if not 0 <= seconds <= 3600:
+            await ctx.send("The hysteresis must be between 0 and 3600 seconds.")
+            return
+
+        await self.__set(ctx.guild, "hysteresis", seconds)
+
+        if seconds:
+            await ctx.send(f"Done. Streaming roles will now be taken away {seconds} seconds after a stream ends.")
+        else:
+            await ctx.send("Done. Streaming roles will now be taken away as soon as a stream ends.")
+
+    @streamrole.command(name="sweep")
+    async def streamrole_sweep(self, ctx: commands.Context) -> None:
+        """Brings everyone's streaming role up to date.
+
+        Every member is checked, and the streaming role is given to or taken from anyone whose role is out of date,
+        such as after the bot was offline. This also happens automatically when the bot starts and when settings
+        change; if a sweep is already running, this shows its progress.
+        """
+
+        guild: discord.Guild = ctx.guild
+        if guild.id not in self.__enabled:
+            await ctx.send(f"StreamRole is not enabled; turn it on with `{ctx.prefix}streamroleset toggle`.")
+            return
+
+        task = self.__sweep_tasks.get(guild.id)
+        if task is None:
+            task = self.__start_sweep(guild)
+
+        message = await ctx.send(str(self.__sweeps[guild.id]))
+        while not task.done():
+            await asyncio.wait({task}, timeout=5)
+            await message.edit(content=str(self.__sweeps[guild.id]))
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, _, after: discord.Role) -> None:
+        """Listens for role updates, which may move the prerequisite role in the hierarchy."""
+
+        self.__roles.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        """Listens for role deletions, which may remove the streaming or prerequisite role."""
+
+        self.__roles.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_presence_update(self, before: discord.Member, after: discord.Member) -> None:
+        """Listens to presence updates to detect starting/stopping streaming."""
+
+        if after.guild.id not in self.__enabled:
+            return
+
+        is_streaming = StreamRole.__is_streaming(after)
+        if is_streaming == StreamRole.__is_streaming(before):
+            # a status or activity change which doesn't affect streaming; by far the most common case
+            return
+
+        await self.__damp(after, is_streaming)
+
     @commands.Cog.listener()
-    async def on_presence_update(self, _, after: discord.Member) -> None:
-        """Listens to member updates to detect starting/stopping streaming."""
+    async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        """Listens to member updates to detect role changes which affect promotion eligibility."""
+
+        if after.guild.id not in self.__enabled:
+            return
+
+        if before.roles == after.roles:
+            return
+
+        await self.__damp(after, StreamRole.__is_streaming(after))
+
+    async def __damp(self, member: discord.Member, is_streaming: bool) -> None:
+        """Brings member's streaming role up to date, holding back edits to smooth out streams which drop and resume.
+
+        Taking the role away waits for the hysteresis window, and is called off if the member starts streaming again
+        in the meantime. Any edit within the window after the member's last edit waits until the window is over; by
+        then it may not be needed at all.
+        """
+
+        guild: discord.Guild = member.guild
+        key = (guild.id, member.id)
+        window = self.__cache[guild.id]["hysteresis"]
+
+        pending = self.__pending_edits.pop(key, None)
+        if pending is not None:
+            # superseded; whatever is needed now is worked out afresh
+            pending.cancel()
+
+        if window <= 0:
+            await self.__update_member(member, is_streaming)
+            return
+
+        roles = self.__guild_roles(guild)
+        if roles.streaming is None:
+            return
+
+        should_have = is_streaming and StreamRole.__can_promote(member, roles)
+        if should_have == self.__has_role(member, roles.streaming):
+            return
+
+        now = time.monotonic()
+        due = now if should_have else now + window
+        due = max(due, self.__quiet_until.get(key, now))
+
+        if due <= now:
+            self.__note_edit(key, now, window)
+            await self.__update_member(member, is_streaming)
+        else:
+            self.__pending_edits[key] = asyncio.get_running_loop().call_later(
+                due - now, self.__release_edit, guild.id, member.id
+            )
+
+    def __release_edit(self, guild_id: int, member_id: int) -> None:
+        """Applies a held back role edit once its time has come, for whatever state the member is in by then."""
+
+        key = (guild_id, member_id)
+        self.__pending_edits.pop(key, None)
+
+        guild: Optional[discord.Guild] = self.bot.get_guild(guild_id)
+        member = guild.get_member(member_id) if guild is not None else None
+        if member is None or guild_id not in self.__enabled:
+            return
+
+        self.__note_edit(key, time.monotonic(), self.__cache[guild_id]["hysteresis"])
+        task = asyncio.create_task(self.__update_member(member, StreamRole.__is_streaming(member)))
+        self.__edit_tasks.add(task)
+        task.add_done_callback(self.__edit_tasks.discard)
+
+    def __note_edit(self, key: Tuple[int, int], now: float, window: float) -> None:
+        """Records a role edit for the member with key, and forgets members whose windows have passed."""
+
+        self.__quiet_until.pop(key, None)
+        self.__quiet_until[key] = now + window
+
+        # the oldest edits come first; windows differ between guilds, so some may stay a little past theirs
+        while self.__quiet_until:
+            oldest, until = next(iter(self.__quiet_until.items()))
+            if until > now:
+                break
+            del self.__quiet_until[oldest]
+
+    async def __update_member(self, member: discord.Member, is_streaming: bool) -> bool:
+        """Gives member the streaming role if they are streaming and may be promoted, or takes it away otherwise.
+
+        Only one role edit per member is in flight at a time. Any update which arrives meanwhile replaces the one
+        before it, and the latest is applied once the edit lands, so a burst of updates costs at most two edits.
+
+        Returns whether a role edit was attempted.
+        """
+
+        guild: discord.Guild = member.guild
+        key = (guild.id, member.id)
 
-        guild: discord.Guild = after.guild
-        config = await self.config.guild(guild).all()
-        is_streaming = any(a.type == discord.ActivityType.streaming for a in after.activities)
-        if config["enabled"] and config["role"] is not None:
-            streaming_role: discord.Role = discord.utils.get(guild.roles, id=config["role"])
+        if key in self.__in_flight:
+            self.__latest[key] = (member, is_streaming)
+            return False
 
+        attempted = False
+        # whether the member has the role after an edit this call made; their cached roles may not show it yet
+        landed: Optional[bool] = None
+        while True:
+            roles = self.__guild_roles(guild)
+            streaming_role = roles.streaming
             if streaming_role is None:
+                break
+
+            should_have = is_streaming and StreamRole.__can_promote(member, roles)
+            has = self.__has_role(member, streaming_role) if landed is None else landed
+            if should_have == has:
+                break
+
+            attempted = True
+            self.__in_flight[key] = should_have
+            try:
+                landed = should_have if await self.__edit_role(member, streaming_role, should_have) else has
+            except asyncio.CancelledError:
+                # the caller gave up, as a sweep does when it is replaced; an update which arrived meanwhile still
+                # needs applying
+                latest = self.__latest.pop(key, None)
+                if latest is not None:
+                    task = asyncio.create_task(self.__update_member(*latest))
+                    self.__edit_tasks.add(task)
+                    task.add_done_callback(self.__edit_tasks.discard)
+                raise
+            finally:
+                del self.__in_flight[key]
+
+            latest = self.__latest.pop(key, None)
+            if latest is None:
+                break
+            member, is_streaming = latest
+
+        return attempted
+
+    def __has_role(self, member: discord.Member, role: discord.Role) -> bool:
+        """Indicates whether member has role, or will have once their role edit in flight lands."""
+
+        return self.__in_flight.get((member.guild.id, member.id), member.get_role(role.id) is not None)
+
+    async def __edit_role(self, member: discord.Member, role: discord.Role, add: bool) -> bool:
+        """Adds role to or removes it from member through the guild's scheduler, logging any failure.
+
+        Returns whether the edit succeeded.
+        """
+
+        guild: discord.Guild = member.guild
+        failure = (
+            f"Failed to {'add' if add else 'remove'} role ID {role.id} {'to' if add else 'from'} member ID {member.id}"
+        )
+
+        try:
+            await self.__scheduler(guild.id).submit(member, role, add)
+            return True
+        except asyncio.QueueFull:
+            log.warning(f"{failure} (server ID {guild.id}): role edit queue is full")
+        except discord.Forbidden:
+            log.warning(f"{failure} (server ID {guild.id}): insufficient permissions")
+        except discord.DiscordException:
+            log.warning(f"{failure} (server ID {guild.id})")
+
+        return False
+
+    def __scheduler(self, guild_id: int) -> RoleEditScheduler:
+        """Gets guild's role edit scheduler, making it if needed."""
+
+        scheduler = self.__schedulers.get(guild_id)
+        if scheduler is None:
+            scheduler = self.__schedulers[guild_id] = RoleEditScheduler(
+                guild_id,
+                StreamRole.__apply_edit,
+                lambda dropped: self.__recover_dropped(guild_id, dropped),
+                rate=self.edit_rate,
+                burst=self.edit_burst,
+                max_queued=self.edit_queue_size,
+                max_attempts=self.edit_attempts,
+            )
+
+        return scheduler
+
+    @staticmethod
+    async def __apply_edit(member: discord.Member, role: discord.Role, add: bool) -> None:
+        """Adds role to or removes it from member."""
+
+        if add:
+            await member.add_roles(role, reason="Member is streaming.")
+        else:
+            await member.remove_roles(role, reason="Member is not streaming.")
+
+    def __recover_dropped(self, guild_id: int, dropped: int) -> None:
+        """Sweeps guild once its role edit queue has emptied, to make up for the edits dropped while it was full."""
+
+        log.warning(
+            f"Dropped {dropped} role edits (server ID {guild_id}) while the queue was full; sweeping to catch up"
+        )
+
+        guild: Optional[discord.Guild] = self.bot.get_guild(guild_id)
+        if guild is not None and guild_id in self.__enabled:
+            self.__start_sweep(guild)
+
+    def __guild_roles(self, guild: discord.Guild) -> GuildRoles:
+        """Gets guild's resolved roles, resolving them if needed; logs an error if the streaming role is gone."""
+
+        roles = self.__roles.get(guild.id)
+        if roles is None:
+            config = self.__cache[guild.id]
+            roles = self.__roles[guild.id] = GuildRoles(guild, config)
+
+            if roles.streaming is None:
                 log.error(
                     f"Failed to find streaming role with ID {config['role']} (server ID {guild.id}); "
                     "this likely means that the role has been deleted"
                 )
-                return
 
-            # is not streaming; attempt to remove streaming role if present
-            if not is_streaming and streaming_role in after.roles:
-                try:
-                    await after.remove_roles(streaming_role, reason="Member is not streaming.")
-                except discord.Forbidden:
-                    log.warning(
-                        f"Failed to remove role ID {streaming_role.id} from member ID {after.id} "
-                        f"(server ID {guild.id}): insufficient permissions"
-                    )
-                except discord.DiscordException:
-                    log.warning(
-                        f"Failed to remove role ID {streaming_role.id} from member ID {after.id} (server ID {guild.id})"
-                    )
-
-            # is streaming; attempt to add streaming role if not present
-            # and if allowed by promotion settings
-            elif is_streaming and streaming_role not in after.roles:
-                if StreamRole.__can_promote(after, config):
-                    try:
-                        await after.add_roles(streaming_role, reason="Member is streaming.")
-                    except discord.Forbidden:
-                        log.warning(
-                            f"Failed to add role ID {streaming_role.id} to member ID {after.id} "
-                            f"(server ID {guild.id}): insufficient permissions"
-                        )
-                    except discord.DiscordException:
-                        log.warning(
-                            f"Failed to add role ID {streaming_role.id} to member ID {after.id} (server ID {guild.id})"
-                        )
+        return roles
 
-    @staticmethod
-    def __can_promote(member: discord.Member, config: dict) -> bool:
-        """Indicates whether member can be given the streaming role based on the promotion rules defined in config."""
+    def __settings(self, guild: discord.Guild) -> Dict[str, Any]:
+        """Gets the cached settings for guild, starting from the defaults if it has none yet."""
 
-        if not config["promote"] or not config["promote_from"]:
-            return True
+        try:
+            return self.__cache[guild.id]
+        except KeyError:
+            return self.__cache.setdefault(guild.id, copy.deepcopy(self.guild_defaults))
 
-        promote_role: discord.Role = discord.utils.get(member.guild.roles, id=config["promote_from"])
+    async def __set(self, guild: discord.Guild, key: str, value: Any) -> None:
+        """Sets one setting for guild, writing through to both Config and the cache."""
 
-        if promote_role in member.roles:
-            return True
+        await self.config.guild(guild).set_raw(key, value=value)
+        self.__settings(guild)[key] = value
+        self.__refresh_enabled(guild.id)
+        self.__roles.pop(guild.id, None)
 
-        if not config["lax_promote"]:
-            return False
+        if key not in self.role_settings:
+            return
+
+        if guild.id in self.__enabled:
+            self.__start_sweep(guild)
+        elif guild.id in self.__sweep_tasks:
+            self.__sweep_tasks.pop(guild.id).cancel()
+
+    async def __sweep_on_load(self) -> None:
+        """Sweeps every enabled guild once the bot is ready, to catch up on anything missed while it was offline."""
+
+        await self.bot.wait_until_red_ready()
+
+        for guild_id in list(self.__enabled):
+            guild: Optional[discord.Guild] = self.bot.get_guild(guild_id)
+            if guild is not None:
+                self.__start_sweep(guild)
+
+    def __start_sweep(self, guild: discord.Guild) -> asyncio.Task:
+        """Starts a sweep of guild, replacing any which is already running."""
 
-        return StreamRole.__has_role_above(member, promote_role)
+        previous = self.__sweep_tasks.pop(guild.id, None)
+        if previous is not None:
+            previous.cancel()
+
+        self.__sweeps[guild.id] = SweepProgress(len(guild.members))
+        task = self.__sweep_tasks[guild.id] = asyncio.create_task(self.__sweep(guild, self.__sweeps[guild.id]))
+        return task
+
+    async def __sweep(self, guild: discord.Guild, progress: SweepProgress) -> None:
+        """Works out who should have the streaming role in guild, then adds and removes it where needed.
+
+        Members are checked in chunks so that large guilds don't hold up the event loop, and role edits are paced to
+        sweep_edits_per_second.
+        """
+
+        try:
+            roles = self.__guild_roles(guild)
+            streaming_role = roles.streaming
+            if streaming_role is None:
+                return
+
+            members: List[discord.Member] = list(guild.members)
+            should_have: Set[int] = set()
+            for start in range(0, len(members), self.sweep_chunk_size):
+                for member in members[start : start + self.sweep_chunk_size]:
+                    if StreamRole.__is_streaming(member) and StreamRole.__can_promote(member, roles):
+                        should_have.add(member.id)
+
+                progress.checked = min(start + self.sweep_chunk_size, len(members))
+                await asyncio.sleep(0)
+
+            has = {m.id for m in streaming_role.members}
+            # removals first, so that nobody keeps the role for longer than they should
+            out_of_date = [*(has - should_have), *(should_have - has)]
+            progress.to_remove = len(has - should_have)
+            progress.to_add = len(should_have - has)
+
+            for member_id in out_of_date:
+                member: Optional[discord.Member] = guild.get_member(member_id)
+                # their presence may have changed since they were checked, so look again
+                if member is not None and await self.__update_member(member, StreamRole.__is_streaming(member)):
+                    await asyncio.sleep(1 / self.sweep_edits_per_second)
+
+                progress.edited += 1
+        finally:
+            progress.finished = True
+            if self.__sweep_tasks.get(guild.id) is asyncio.current_task():
+                del self.__sweep_tasks[guild.id]
+
+    def __refresh_enabled(self, guild_id: int) -> None:
+        """Brings guild's membership of the enabled set up to date with its settings."""
+
+        settings = self.__cache[guild_id]
+        if settings["enabled"] and settings["role"] is not None:
+            self.__enabled.add(guild_id)
+        else:
+            self.__enabled.discard(guild_id)
+
+    @staticmethod
+    def __is_streaming(member: discord.Member) -> bool:
+        """Indicates whether member is streaming."""
+
+        return any(a.type == discord.ActivityType.streaming for a in member.activities)
 
     @staticmethod
-    def __has_role_above(member: discord.Member, role: discord.Role) -> bool:
-        """Indicates whether member has a role which is higher than role in the hierarchy."""
+    def __can_promote(member: discord.Member, roles: GuildRoles) -> bool:
+        """Indicates whether member can be given the streaming role based on the guild's promotion rules."""
+
+        if roles.promote_from_id is None:
+            return True
+
+        if roles.lax_position is not None:
+            # if their top role is high enough, then they have a role that's high enough; if not, they don't
+            return member.top_role.position >= roles.lax_position
 
-        # if their top role is high enough, then they have a role that's high enough; if not, they don't
-        return member.top_role > role
+        return member.get_role(roles.promote_from_id) is not None
@@ -0,0 +1,27 @@
+import time
+
+
+class SweepProgress:
+    """How far a reconciliation sweep of one guild has got."""
+
+    __slots__ = ("total", "checked", "to_add", "to_remove", "edited", "started", "finished")
+
+    def __init__(self, total: int) -> None:
+        # members to check, how many have been, and the role edits found to be needed
+        self.total = total
+        self.checked = 0
+        self.to_add = 0
+        self.to_remove = 0
+        self.edited = 0
+
+        self.started = time.monotonic()
+        self.finished = False
+
+    def __str__(self) -> str:
+        elapsed = time.monotonic() - self.started
+        state = "Finished" if self.finished else "Sweeping"
+        return (
+            f"{state}: checked {self.checked}/{self.total} members; "
+            f"{self.to_add} to add and {self.to_remove} to remove the streaming role, {self.edited} done "
+            f"({elapsed:.0f} seconds)"
+        )
@@ -6,3 +6,14 @@ class WhisperType(Enum):
     ONLY = "only"
     BOTH = "both"
     FALLBACK = "fall"
+
+
+class MessageOrder(Enum):
+    RANDOM = "random"
+    SHUFFLE = "shuffle"
+
+
+class OverloadAction(Enum):
+    DROP = "drop"
+    DIGEST = "digest"
+    WHISPERS = "whispers"
@@ -1,2 +1,13 @@
 class WhisperError(Exception):
     pass
+
+
+class WhisperRateLimitError(WhisperError):
+    pass
+
+
+class TemplateError(Exception):
+    def __init__(self, message):
+        super().__init__(message)
+
+        self.message = message
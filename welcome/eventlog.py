@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+log = logging.getLogger("red.tmerc.welcome")
+
+# (guild ID, event, member ID, account creation time, event time); times are Unix timestamps
+Row = Tuple[int, str, int, float, float]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    guild_id INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    member_id INTEGER NOT NULL,
+    created REAL NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_by_guild_time ON events (guild_id, event, at);
+"""
+
+
+class EventLog:
+    """An append-only SQLite log of membership events, for answering questions about recent joins and leaves.
+
+    Events are buffered in memory and written in batches. All database work happens on a single background thread,
+    so it never blocks the event loop and the connection is never shared between threads.
+    """
+
+    __slots__ = ("path", "flush_interval", "_executor", "_connection", "_pending", "_task")
+
+    def __init__(self, path: Path, flush_interval: float = 2.0) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="welcome-eventlog")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pending: List[Row] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def open(self) -> None:
+        """Opens the database, creating it if needed, and starts writing events in the background."""
+
+        def connect() -> None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(str(self.path))
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+
+        await self.__run(connect)
+        self._task = asyncio.create_task(self.__flush_periodically())
+
+    async def close(self) -> None:
+        """Writes any buffered events and closes the database."""
+
+        if self._task is not None:
+            self._task.cancel()
+
+        await self.flush()
+        await self.__run(self._connection.close)
+        self._executor.shutdown(wait=False)
+
+    def add(self, guild_id: int, event: str, member_id: int, created: float, at: float) -> None:
+        """Buffers one event to be written with the next batch."""
+
+        self._pending.append((guild_id, event, member_id, created, at))
+
+    async def flush(self) -> None:
+        """Writes every buffered event."""
+
+        if not self._pending:
+            return
+
+        rows, self._pending = self._pending, []
+
+        def write() -> None:
+            with self._connection:
+                self._connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?)", rows)
+
+        await self.__run(write)
+
+    async def query(
+        self, guild_id: int, event: str, since: float, *, created_after: Optional[float] = None, limit: int = 1000
+    ) -> List[Tuple[int, float, float]]:
+        """Gets (member ID, account creation time, event time) for each event in guild since the given time, newest
+        first, optionally only for accounts created after created_after.
+        """
+
+        await self.flush()
+
+        sql = "SELECT member_id, created, at FROM events WHERE guild_id = ? AND event = ? AND at >= ?"
+        params: List[Any] = [guild_id, event, since]
+        if created_after is not None:
+            sql += " AND created > ?"
+            params.append(created_after)
+        sql += " ORDER BY at DESC LIMIT ?"
+        params.append(limit)
+
+        return await self.__run(lambda: self._connection.execute(sql, params).fetchall())
+
+    async def forget_member(self, member_id: int) -> None:
+        """Deletes every event for member."""
+
+        await self.flush()
+
+        def delete() -> None:
+            with self._connection:
+                self._connection.execute("DELETE FROM events WHERE member_id = ?", (member_id,))
+
+        await self.__run(delete)
+
+    async def __flush_periodically(self) -> None:
+        """Writes the buffered events every flush_interval seconds, forever."""
+
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except sqlite3.Error:
+                log.exception(f"Failed to write events to {self.path}; they have been discarded")
+
+    async def __run(self, func: Callable[[], T]) -> T:
+        """Runs func on the database thread."""
+
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func)
@@ -0,0 +1,116 @@
+import base64
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Optional, Sequence
+
+
+class EventHistory:
+    """Per-day counts of each event for one guild, covering the most recent `days` days.
+
+    Each event has a ring buffer of running totals indexed by day ordinal, so the number of events over any span of
+    days is the difference of two entries, no matter how long the span is.
+    """
+
+    __slots__ = ("days", "last_day", "_totals")
+
+    def __init__(self, events: Sequence[str], days: int = 366) -> None:
+        self.days = days
+        # the most recent day which has been recorded, or None if nothing has been yet
+        self.last_day: Optional[int] = None
+        self._totals: Dict[str, array] = {event: array("Q", bytes(8 * days)) for event in events}
+
+    def record(self, event: str, day: int) -> None:
+        """Counts one event on day, which must not be before the last recorded day."""
+
+        self.__advance(day)
+        self._totals[event][day % self.days] += 1
+
+    def count(self, event: str, day: int, span: int) -> int:
+        """Gets how many events happened in the span days ending with (and including) day.
+
+        span is capped to the number of days which are kept, minus one.
+        """
+
+        span = min(span, self.days - 1)
+        return self.__total_at(event, day) - self.__total_at(event, day - span)
+
+    def daily(self, event: str, day: int, span: int) -> Sequence[int]:
+        """Gets the number of events on each of the span days ending with (and including) day, oldest first."""
+
+        span = min(span, self.days - 1)
+        totals = [self.__total_at(event, d) for d in range(day - span, day + 1)]
+        return [b - a for a, b in zip(totals, totals[1:])]
+
+    def to_data(self) -> Dict[str, Any]:
+        """Packs the history into a compact, JSON-friendly form: zlib-compressed daily counts for each event."""
+
+        data: Dict[str, Any] = {"days": self.days, "last_day": self.last_day}
+        if self.last_day is None:
+            return data
+
+        for event in self._totals:
+            counts = array("I", self.daily(event, self.last_day, self.days - 1))
+            if sys.byteorder == "big":
+                counts.byteswap()
+            data[event] = base64.b64encode(zlib.compress(counts.tobytes())).decode("ascii")
+
+        return data
+
+    @classmethod
+    def from_data(cls, events: Sequence[str], data: Optional[Dict[str, Any]]) -> "EventHistory":
+        """Unpacks a history which was packed by to_data. Events missing from data start out empty."""
+
+        if not data:
+            return cls(events)
+
+        history = cls(events, data["days"])
+        last_day = data["last_day"]
+        if last_day is None:
+            return history
+
+        history.last_day = last_day
+        for event in events:
+            if event not in data:
+                continue
+
+            counts = array("I")
+            counts.frombytes(zlib.decompress(base64.b64decode(data[event])))
+            if sys.byteorder == "big":
+                counts.byteswap()
+
+            # counts are for the days - 1 days before last_day, oldest first
+            totals = history._totals[event]
+            total = 0
+            first_day = last_day - len(counts) + 1
+            for offset, n in enumerate(counts):
+                total += n
+                totals[(first_day + offset) % history.days] = total
+
+        return history
+
+    def __advance(self, day: int) -> None:
+        """Moves the last recorded day forward to day, carrying each running total over the days in between."""
+
+        if self.last_day is None:
+            self.last_day = day
+            return
+
+        if day <= self.last_day:
+            return
+
+        for totals in self._totals.values():
+            carry = totals[self.last_day % self.days]
+            for d in range(max(self.last_day + 1, day - self.days + 1), day + 1):
+                totals[d % self.days] = carry
+
+        self.last_day = day
+
+    def __total_at(self, event: str, day: int) -> int:
+        """Gets the running total for event as of the end of day."""
+
+        if self.last_day is None or day <= self.last_day - self.days:
+            # before anything was recorded, or too long ago to still be kept
+            return 0
+
+        return self._totals[event][min(day, self.last_day) % self.days]
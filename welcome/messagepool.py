@@ -0,0 +1,36 @@
+import random
+from typing import List, Optional, Sequence
+
+from .enums import MessageOrder
+
+
+class MessagePool:
+    """A read-only set of message formats for one event, from which each notice's format is picked.
+
+    In random order every pick is independent. In shuffle order the formats are dealt from a shuffled bag, so none is
+    repeated until all of them have been used.
+    """
+
+    __slots__ = ("formats", "order", "_bag", "_last")
+
+    def __init__(self, formats: Sequence[str], order: MessageOrder) -> None:
+        self.formats = tuple(formats)
+        self.order = order
+        self._bag: List[str] = []
+        self._last: Optional[str] = None
+
+    def pick(self) -> str:
+        """Picks the format for the next notice."""
+
+        if self.order is MessageOrder.RANDOM or len(self.formats) == 1:
+            return random.choice(self.formats)
+
+        if not self._bag:
+            self._bag = list(self.formats)
+            random.shuffle(self._bag)
+            if self._bag[-1] == self._last:
+                # don't repeat the last format of the previous bag straight away
+                self._bag[0], self._bag[-1] = self._bag[-1], self._bag[0]
+
+        self._last = self._bag.pop()
+        return self._last
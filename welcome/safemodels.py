@@ -1,51 +1,90 @@
+from typing import Any, Dict, Tuple
+
 import discord
 
 
-class SafeMember:
-    def __init__(self, member: discord.Member) -> None:
-        self.name = str(member.name)
-        self.display_name = str(member.display_name)
-        self.nick = str(getattr(member, "nick", ""))
-        self.id = str(member.id)
-        self.mention = str(member.mention)
-        self.discriminator = str(member.discriminator)
-        self.color = str(member.color)
-        self.colour = str(member.colour)
-        self.created_at = str(member.created_at)
-
-    def __str__(self):
-        return self.name
+class _SafeModel:
+    """Exposes a fixed set of an object's attributes as strings, for use in user-provided format strings.
 
-    def __getattr__(self, name):
-        return self
+    Each attribute is converted the first time it is used and remembered after that. Any attribute which is not exposed
+    evaluates to the model itself, so formats can never reach the underlying object.
+    """
 
+    __slots__ = ("_obj",)
+    _fields: Tuple[str, ...] = ()
 
-class SafeRole:
-    def __init__(self, role: discord.Role) -> None:
-        self.name = str(role.name)
-        self.id = str(role.id)
-        self.mention = str(role.mention)
-        self.color = str(role.color)
-        self.colour = str(role.colour)
-        self.position = str(role.position)
-        self.created_at = str(role.created_at)
-
-    def __str__(self):
-        return self.name
+    def __init__(self, obj: Any) -> None:
+        self._obj = obj
 
-    def __getattr__(self, name):
-        return self
+    def __getattribute__(self, name: str) -> Any:
+        # nothing private, including the wrapped object, may be reached from a format string
+        if name.startswith("_"):
+            return self
 
+        return object.__getattribute__(self, name)
 
-class SafeGuild:
-    def __init__(self, guild: discord.Guild) -> None:
-        self.name = str(guild.name)
-        self.id = str(guild.id)
-        self.description = str(guild.description)
-        self.created_at = str(guild.created_at)
+    def __getattr__(self, name: str) -> Any:
+        # only called for fields which have not been used yet, and for unknown names
+        if name in type(self)._fields:
+            value = str(getattr(object.__getattribute__(self, "_obj"), name, ""))
+            setattr(self, name, value)
+            return value
 
-    def __str__(self):
+        return self
+
+    def __str__(self) -> str:
         return self.name
 
-    def __getattr__(self, name):
-        return self
+
+class _CachedSafeModel(_SafeModel):
+    """A safe model which is shared between all uses of the same object until it is forgotten."""
+
+    __slots__ = ()
+    _instances: Dict[int, "_CachedSafeModel"]
+
+    def __new__(cls, obj: Any) -> "_CachedSafeModel":
+        instance = cls._instances.get(obj.id)
+        if instance is None or object.__getattribute__(instance, "_obj") is not obj:
+            instance = cls._instances[obj.id] = super().__new__(cls)
+
+        return instance
+
+    @classmethod
+    def forget(cls, obj_id: int) -> None:
+        """Drops the shared model for the object with the given ID, so that it is rebuilt on its next use."""
+
+        cls._instances.pop(obj_id, None)
+
+
+class SafeMember(_SafeModel):
+    _fields = __slots__ = (
+        "name",
+        "display_name",
+        "nick",
+        "id",
+        "mention",
+        "discriminator",
+        "color",
+        "colour",
+        "created_at",
+        "joined_at",
+    )
+
+    def __init__(self, member: discord.Member) -> None:
+        super().__init__(member)
+
+
+class SafeRole(_CachedSafeModel):
+    _fields = __slots__ = ("name", "id", "mention", "color", "colour", "position", "created_at")
+    _instances: Dict[int, "SafeRole"] = {}
+
+    def __init__(self, role: discord.Role) -> None:
+        super().__init__(role)
+
+
+class SafeGuild(_CachedSafeModel):
+    _fields = __slots__ = ("name", "id", "description", "created_at")
+    _instances: Dict[int, "SafeGuild"] = {}
+
+    def __init__(self, guild: discord.Guild) -> None:
+        super().__init__(guild)
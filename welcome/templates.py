@@ -0,0 +1,76 @@
+import _string
+import functools
+import string
+from typing import Any, Callable, FrozenSet, Mapping, Set
+
+from .errors import TemplateError
+
+# fields which may be used in channel notices (including bot notices and whisper fallbacks)
+NOTICE_FIELDS = frozenset({"member", "bot", "server", "count", "plural", "roles"})
+# fields which may be used in whispers
+WHISPER_FIELDS = frozenset({"member", "server"})
+
+_formatter = string.Formatter()
+
+
+class Template:
+    """A message format which has been checked, along with the fields it uses."""
+
+    __slots__ = ("source", "fields")
+
+    def __init__(self, source: str, fields: FrozenSet[str]) -> None:
+        self.source = source
+        self.fields = fields
+
+    def render(self, context: Mapping[str, Callable[[], Any]]) -> str:
+        """Fills in the template, only calling the context factories for the fields which it uses."""
+
+        return self.source.format_map({name: context[name]() for name in self.fields})
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_template(source: str, allowed: FrozenSet[str] = NOTICE_FIELDS) -> Template:
+    """Parses source once, making sure that it only uses fields from allowed.
+
+    Raises TemplateError if source is malformed, uses a field which is not allowed, or reaches into a private
+    attribute or key (one starting with an underscore), which could expose things like the bot's token.
+    """
+
+    return Template(source, frozenset(_collect_fields(source, allowed)))
+
+
+def _collect_fields(source: str, allowed: FrozenSet[str]) -> Set[str]:
+    """Gets the root names of all fields used in source, including those nested in format specs, checking each
+    attribute and key along the way.
+    """
+
+    try:
+        parsed = list(_formatter.parse(source))
+    except ValueError as e:
+        raise TemplateError(f"The format is malformed: {e}.")
+
+    fields = set()
+    for _, field_name, format_spec, _ in parsed:
+        if field_name is None:
+            continue
+
+        # the same split str.format does: the root, then each .attribute or [key]
+        root, rest = _string.formatter_field_name_split(field_name)
+        if root == "" or isinstance(root, int):
+            raise TemplateError("Unnamed fields like `{}` are not allowed.")
+        if root not in allowed:
+            raise TemplateError(
+                f"`{{{root}}}` is not a known field; use one of "
+                + ", ".join(f"`{{{f}}}`" for f in sorted(allowed))
+                + "."
+            )
+
+        for _, key in rest:
+            if isinstance(key, str) and key.startswith("_"):
+                raise TemplateError(f"`{{{field_name}}}` uses `{key}`, which is private.")
+
+        fields.add(root)
+        if format_spec:
+            fields |= _collect_fields(format_spec, allowed)
+
+    return fields
@@ -0,0 +1,56 @@
+import json
+import time
+from pathlib import Path
+from typing import Dict, TextIO, Union
+
+import discord
+
+
+class TraceRecorder:
+    """Writes anonymized membership events to a JSON Lines file, for replaying against the cog later.
+
+    Each line holds the event, the seconds since recording started, and stand-in numbers for the server and user, so
+    that events for the same server or user can still be matched up. The only other things kept about a user are
+    whether they are a bot and how old their account was, in seconds. Raises FileExistsError if path already exists.
+    """
+
+    __slots__ = ("path", "count", "_file", "_started", "_guilds", "_users")
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.count = 0
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # never added to; a second recording would restart the times and stand-ins and be mixed up with the first
+        self._file: TextIO = path.open("x", encoding="utf-8")
+        self._started = time.monotonic()
+        self._guilds: Dict[int, int] = {}
+        self._users: Dict[int, int] = {}
+
+    def record(self, event: str, guild: discord.Guild, user: Union[discord.Member, discord.User]) -> None:
+        """Writes one event."""
+
+        now = time.monotonic()
+        age = (discord.utils.utcnow() - user.created_at).total_seconds()
+        line = {
+            "t": round(now - self._started, 4),
+            "event": event,
+            "guild": self._guilds.setdefault(guild.id, len(self._guilds)),
+            "user": self._users.setdefault(user.id, len(self._users)),
+            "bot": user.bot,
+            "age": int(age),
+        }
+
+        self._file.write(json.dumps(line, separators=(",", ":")) + "\n")
+        self.count += 1
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since recording started."""
+
+        return time.monotonic() - self._started
+
+    def close(self) -> None:
+        """Finishes writing the file."""
+
+        self._file.close()
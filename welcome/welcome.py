@@ -1,16 +1,26 @@
 import asyncio
+import copy
 import datetime
+import functools
 import logging
-import random
-from typing import Optional, Union
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, FrozenSet, List, Optional, Set, Tuple, Union
 
 import discord
 from redbot.core import Config, checks, commands
-from redbot.core.utils.chat_formatting import box, humanize_list, pagify
-
-from .enums import WhisperType
-from .errors import WhisperError
+from redbot.core.data_manager import cog_data_path
+from redbot.core.utils.chat_formatting import box, humanize_list, humanize_timedelta, pagify
+
+from .enums import MessageOrder, OverloadAction, WhisperType
+from .errors import TemplateError, WhisperError, WhisperRateLimitError
+from .eventlog import EventLog
+from .history import EventHistory
+from .messagepool import MessagePool
 from .safemodels import SafeGuild, SafeMember
+from .templates import NOTICE_FIELDS, WHISPER_FIELDS, compile_template
+from .trace import TraceRecorder
 
 __author__ = "tmerc"
 
@@ -19,6 +29,16 @@ log = logging.getLogger("red.tmerc.welcome")
 ENABLED = "enabled"
 DISABLED = "disabled"
 
+EVENTS = ("join", "leave", "ban", "unban")
+
+# how each event reads in a digest, for one member and for several
+DIGEST_VERBS = {
+    "join": ("joined", "joined"),
+    "leave": ("left", "left"),
+    "ban": ("was banned", "were banned"),
+    "unban": ("was unbanned", "were unbanned"),
+}
+
 
 class Welcome(commands.Cog):
     """Announce when users join or leave a server."""
@@ -32,48 +52,230 @@ class Welcome(commands.Cog):
     guild_defaults = {
         "enabled": False,
         "channel": None,
-        "date": None,
+        "eventlog": False,
         "join": {
             "enabled": True,
             "channel": None,
+            "mirrors": [],
             "delete": False,
-            "last": None,
-            "counter": 0,
+            "keep": 1,
             "whisper": {"state": "off", "message": default_whisper},
             "messages": [default_join],
+            "order": "random",
             "bot": None,
+            "digest": {"enabled": False, "threshold": 5, "window": 10},
         },
         "leave": {
             "enabled": True,
             "channel": None,
+            "mirrors": [],
             "delete": False,
-            "last": None,
-            "counter": 0,
+            "keep": 1,
             "messages": [default_leave],
+            "order": "random",
         },
         "ban": {
             "enabled": True,
             "channel": None,
+            "mirrors": [],
             "delete": False,
-            "last": None,
-            "counter": 0,
+            "keep": 1,
             "messages": [default_ban],
+            "order": "random",
         },
         "unban": {
             "enabled": True,
             "channel": None,
+            "mirrors": [],
             "delete": False,
-            "last": None,
-            "counter": 0,
+            "keep": 1,
             "messages": [default_unban],
+            "order": "random",
         },
+        "overload": {
+            "enabled": False,
+            "backlog": 100,
+            "latency": 30,
+            "action": "drop",
+            "priority": ["ban", "unban", "join", "leave"],
+        },
+    }
+
+    # runtime state which changes with every event, kept apart from the settings so that saving it stays cheap; each
+    # notice is kept as [channel ID, message ID, ...], with one message ID per page
+    state_defaults = {
+        "date": None,
+        "history": {},
+        **{event: {"counter": 0, "notices": []} for event in EVENTS},
     }
 
+    global_defaults = {"queue_size": 1000, "schema_version": 1}
+
+    # how many channels one notice is sent to at once, and how many extra channels each event may mirror to
+    notice_concurrency = 4
+    max_mirrors = 10
+
+    # seconds between writes of buffered counters to Config
+    counter_flush_interval = 5
+
+    # seconds a leave is held back in case the member was banned, so a ban doesn't also produce a leave notice
+    ban_leave_window = 3.0
+
+    # seconds unloading waits for the events, digests, and whispers already received to be handled
+    unload_timeout = 10.0
+
+    # how many whispers may be sent at once, how many may wait, and how often a rate-limited one is tried
+    whisper_concurrency = 4
+    whisper_queue_size = 1000
+    whisper_attempts = 3
+    # seconds to pause all whispers after the first rate limit; doubles with each further attempt
+    whisper_backoff = 5.0
+
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
         self.config = Config.get_conf(self, 86345009)
+        self.config.register_global(**self.global_defaults)
         self.config.register_guild(**self.guild_defaults)
+        self.config.init_custom("STATE", 1)
+        self.config.register_custom("STATE", **self.state_defaults)
+
+        # guild ID -> full settings document, kept in sync with Config by __set
+        self.__cache: Dict[int, Dict[str, Any]] = {}
+        # guild ID -> full state document; counters are saved by __flush_counters, everything else by __set_state
+        self.__states: Dict[int, Dict[str, Any]] = {}
+
+        # guild ID -> monotonic times of recent join notices, used to detect bursts
+        self.__recent_joins: Dict[int, Deque[float]] = defaultdict(deque)
+        # (guild ID, event) -> members waiting to be announced in the next digest
+        self.__digest_buffers: Dict[Tuple[int, str], List[discord.Member]] = {}
+        self.__digest_tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+
+        # (guild ID, user ID) -> leave waiting out the ban window, as (member, timer which will queue it)
+        self.__held_leaves: Dict[Tuple[int, int], Tuple[discord.Member, asyncio.TimerHandle]] = {}
+        # (guild ID, user ID) -> monotonic time of a recent ban, for leaves which arrive after their ban; oldest first
+        self.__recent_bans: Dict[Tuple[int, int], float] = {}
+
+        # guild ID -> events waiting to be handled, in order, by that guild's worker
+        self.__queues: Dict[int, asyncio.Queue] = {}
+        self.__workers: Dict[int, asyncio.Task] = {}
+        self.__queue_size: int = self.global_defaults["queue_size"]
+        # guild ID -> seconds recent events spent waiting in the queue
+        self.__queue_waits: Dict[int, Deque[float]] = defaultdict(lambda: deque(maxlen=1000))
+        self.__queue_dropped: Dict[int, int] = defaultdict(int)
+        # guild ID -> how overloaded the guild's worker was when it took its current event; 0 when keeping up
+        self.__overload_levels: Dict[int, int] = {}
+        # guild ID -> event (or "whisper") -> how many were shed by the overload policy
+        self.__shed: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+        # (guild ID, event) -> message formats to pick from; dropped when the formats or their order change
+        self.__pools: Dict[Tuple[int, str], MessagePool] = {}
+
+        # guild ID -> event -> resolved notice channel; cleared whenever the answer could change
+        self.__channels: Dict[int, Dict[str, Optional[discord.TextChannel]]] = defaultdict(dict)
+
+        # counters live in the state cache and are written back in batches; guild ID -> keys not yet written
+        self.__dirty_counters: Dict[int, Set[str]] = defaultdict(set)
+        self.__date: int = Welcome.__today()
+        # guild ID -> daily event counts, unpacked from the guild's state on first use
+        self.__histories: Dict[int, EventHistory] = {}
+        self.__counter_tasks: List[asyncio.Task] = []
+
+        # whispers waiting to be sent, as (member, whether to fall back to a notice if the whisper fails)
+        self.__whispers: asyncio.Queue = asyncio.Queue(maxsize=self.whisper_queue_size)
+        self.__whisper_workers: List[asyncio.Task] = []
+        # monotonic time before which no whisper should be attempted, after hitting a rate limit
+        self.__whispers_paused_until: float = 0.0
+
+        # writes every membership event to a file while a trace is being recorded
+        self.__recorder: Optional[TraceRecorder] = None
+        # membership events of guilds which have the event log on; opened once any guild turns it on
+        self.__event_log: Optional[EventLog] = None
+
+    async def cog_load(self) -> None:
+        """Loads the settings of every guild into memory and starts the counter tasks."""
+
+        self.__queue_size = await self.config.queue_size()
+
+        if await self.config.schema_version() < 2:
+            await self.__migrate_state()
+
+        for guild_id, data in (await self.config.all_guilds()).items():
+            # all_guilds only merges the defaults one level deep
+            self.__cache[guild_id] = self.config.guild_from_id(guild_id).nested_update(data)
+
+        for guild_id, data in (await self.config.custom("STATE").all()).items():
+            self.__states[int(guild_id)] = self.config.custom("STATE", guild_id).nested_update(data)
+
+        if self.__event_log_path().exists() or any(s["eventlog"] for s in self.__cache.values()):
+            await self.__open_event_log()
+
+        self.__counter_tasks = [
+            asyncio.create_task(self.__flush_counters_periodically()),
+            asyncio.create_task(self.__roll_over_daily()),
+        ]
+
+        self.__whisper_workers = [asyncio.create_task(self.__send_whispers()) for _ in range(self.whisper_concurrency)]
+
+    async def cog_unload(self) -> None:
+        """Handles the events already received, stops the workers, and writes out the buffered counters.
+
+        Pending digests and held leaves are queued straight away rather than waiting out their windows. Everything
+        queued is given unload_timeout seconds to finish; whatever is left after that is lost.
+        """
+
+        digest_tasks = list(self.__digest_tasks.values())
+        for task in digest_tasks:
+            # each queues its digest as it is cancelled
+            task.cancel()
+        await asyncio.gather(*digest_tasks, return_exceptions=True)
+
+        held_leaves = list(self.__held_leaves.values())
+        self.__held_leaves.clear()
+        for member, timer in held_leaves:
+            # no ban can replace them now
+            timer.cancel()
+            self.__enqueue(member.guild, self.__handle_event, member.guild, member, "leave")
+
+        try:
+            await asyncio.wait_for(self.__drain(), self.unload_timeout)
+        except asyncio.TimeoutError:
+            left = sum(q.qsize() for q in self.__queues.values())
+            log.warning(
+                f"Gave up on {left} queued events and {self.__whispers.qsize()} queued DMs after waiting "
+                f"{self.unload_timeout:g} seconds to unload"
+            )
+
+        for task in self.__workers.values():
+            task.cancel()
+
+        for task in self.__counter_tasks:
+            task.cancel()
+
+        for task in self.__whisper_workers:
+            task.cancel()
+
+        await self.__flush_counters()
+
+        if self.__recorder is not None:
+            self.__recorder.close()
+
+        if self.__event_log is not None:
+            await self.__event_log.close()
+
+    async def __drain(self) -> None:
+        """Waits until every queued event and whisper has been handled, including any which those queue in turn."""
+
+        while True:
+            await asyncio.gather(*(q.join() for q in list(self.__queues.values())), self.__whispers.join())
+            if self.__whispers.empty() and all(q.empty() for q in self.__queues.values()):
+                return
+
+    async def red_delete_data_for_user(self, *, requester: str, user_id: int) -> None:
+        """Deletes a user's membership events from the event log."""
+
+        if self.__event_log is not None:
+            await self.__event_log.forget_member(user_id)
 
     @commands.group(aliases=["welcomeset"], fallback="state")
     @commands.guild_only()
@@ -85,7 +287,7 @@ class Welcome(commands.Cog):
 
         if ctx.invoked_subcommand is None:
             guild: discord.Guild = ctx.guild
-            c = await self.config.guild(guild).all()
+            c = self.__settings(guild)
 
             channel = await self.__get_channel(guild, "default")
             join_channel = await self.__get_channel(guild, "join")
@@ -95,6 +297,7 @@ class Welcome(commands.Cog):
 
             j = c["join"]
             jw = j["whisper"]
+            jd = j["digest"]
             v = c["leave"]
             b = c["ban"]
             u = c["unban"]
@@ -106,7 +309,11 @@ class Welcome(commands.Cog):
                 emb.add_field(
                     name="General",
                     inline=False,
-                    value=f"**Enabled:** {c['enabled']}\n**Channel:** {channel.mention}\n",
+                    value=(
+                        f"**Enabled:** {c['enabled']}\n"
+                        f"**Channel:** {channel.mention}\n"
+                        f"**Event log:** {c['eventlog']}\n"
+                    ),
                 )
                 emb.add_field(
                     name="Join",
@@ -114,11 +321,14 @@ class Welcome(commands.Cog):
                     value=(
                         f"**Enabled:** {j['enabled']}\n"
                         f"**Channel:** {join_channel.mention}\n"
-                        f"**Delete previous:** {j['delete']}\n"
+                        f"**Mirrors:** {Welcome.__mirror_list(guild, j['mirrors'], mention=True)}\n"
+                        f"**Delete previous:** {j['delete']} (keeping {j['keep']})\n"
                         f"**Whisper state:** {jw['state']}\n"
                         f"**Whisper message:** {whisper_message}\n"
-                        f"**Messages:** {len(j['messages'])}; do `{ctx.prefix}welcomeset join msg list` for a list\n"
-                        f"**Bot message:** {j['bot']}"
+                        f"**Messages:** {len(j['messages'])}, in {j['order']} order; "
+                        f"do `{ctx.prefix}welcomeset join msg list` for a list\n"
+                        f"**Bot message:** {j['bot']}\n"
+                        f"**Digest:** {jd['enabled']} ({jd['threshold']} joins within {jd['window']} seconds)"
                     ),
                 )
                 emb.add_field(
@@ -127,8 +337,10 @@ class Welcome(commands.Cog):
                     value=(
                         f"**Enabled:** {v['enabled']}\n"
                         f"**Channel:** {leave_channel.mention}\n"
-                        f"**Delete previous:** {v['delete']}\n"
-                        f"**Messages:** {len(v['messages'])}; do `{ctx.prefix}welcomeset leave msg list` for a list\n"
+                        f"**Mirrors:** {Welcome.__mirror_list(guild, v['mirrors'], mention=True)}\n"
+                        f"**Delete previous:** {v['delete']} (keeping {v['keep']})\n"
+                        f"**Messages:** {len(v['messages'])}, in {v['order']} order; "
+                        f"do `{ctx.prefix}welcomeset leave msg list` for a list\n"
                     ),
                 )
                 emb.add_field(
@@ -137,8 +349,10 @@ class Welcome(commands.Cog):
                     value=(
                         f"**Enabled:** {b['enabled']}\n"
                         f"**Channel:** {ban_channel.mention}\n"
-                        f"**Delete previous:** {b['delete']}\n"
-                        f"**Messages:** {len(b['messages'])}; do `{ctx.prefix}welcomeset ban msg list` for a list\n"
+                        f"**Mirrors:** {Welcome.__mirror_list(guild, b['mirrors'], mention=True)}\n"
+                        f"**Delete previous:** {b['delete']} (keeping {b['keep']})\n"
+                        f"**Messages:** {len(b['messages'])}, in {b['order']} order; "
+                        f"do `{ctx.prefix}welcomeset ban msg list` for a list\n"
                     ),
                 )
                 emb.add_field(
@@ -147,8 +361,10 @@ class Welcome(commands.Cog):
                     value=(
                         f"**Enabled:** {u['enabled']}\n"
                         f"**Channel:** {unban_channel.mention}\n"
-                        f"**Delete previous:** {u['delete']}\n"
-                        f"**Messages:** {len(u['messages'])}; do `{ctx.prefix}welcomeset unban msg list` for a list\n"
+                        f"**Mirrors:** {Welcome.__mirror_list(guild, u['mirrors'], mention=True)}\n"
+                        f"**Delete previous:** {u['delete']} (keeping {u['keep']})\n"
+                        f"**Messages:** {len(u['messages'])}, in {u['order']} order; "
+                        f"do `{ctx.prefix}welcomeset unban msg list` for a list\n"
                     ),
                 )
 
@@ -157,30 +373,40 @@ class Welcome(commands.Cog):
                 msg = box(
                     f"  Enabled: {c['enabled']}\n"
                     f"  Channel: {channel}\n"
+                    f"  Event log: {c['eventlog']}\n"
                     f"  Join:\n"
                     f"    Enabled: {j['enabled']}\n"
                     f"    Channel: {join_channel}\n"
-                    f"    Delete previous: {j['delete']}\n"
+                    f"    Mirrors: {Welcome.__mirror_list(guild, j['mirrors'], mention=False)}\n"
+                    f"    Delete previous: {j['delete']} (keeping {j['keep']})\n"
                     f"    Whisper:\n"
                     f"      State: {jw['state']}\n"
                     f"      Message: {whisper_message}\n"
-                    f"    Messages: {len(j['messages'])}; do '{ctx.prefix}welcomeset join msg list' for a list\n"
+                    f"    Messages: {len(j['messages'])}, in {j['order']} order; "
+                    f"do '{ctx.prefix}welcomeset join msg list' for a list\n"
                     f"    Bot message: {j['bot']}\n"
+                    f"    Digest: {jd['enabled']} ({jd['threshold']} joins within {jd['window']} seconds)\n"
                     f"  Leave:\n"
                     f"    Enabled: {v['enabled']}\n"
                     f"    Channel: {leave_channel}\n"
-                    f"    Delete previous: {v['delete']}\n"
-                    f"    Messages: {len(v['messages'])}; do '{ctx.prefix}welcomeset leave msg list' for a list\n"
+                    f"    Mirrors: {Welcome.__mirror_list(guild, v['mirrors'], mention=False)}\n"
+                    f"    Delete previous: {v['delete']} (keeping {v['keep']})\n"
+                    f"    Messages: {len(v['messages'])}, in {v['order']} order; "
+                    f"do '{ctx.prefix}welcomeset leave msg list' for a list\n"
                     f"  Ban:\n"
                     f"    Enabled: {b['enabled']}\n"
                     f"    Channel: {ban_channel}\n"
-                    f"    Delete previous: {b['delete']}\n"
-                    f"    Messages: {len(b['messages'])}; do '{ctx.prefix}welcomeset ban msg list' for a list\n"
+                    f"    Mirrors: {Welcome.__mirror_list(guild, b['mirrors'], mention=False)}\n"
+                    f"    Delete previous: {b['delete']} (keeping {b['keep']})\n"
+                    f"    Messages: {len(b['messages'])}, in {b['order']} order; "
+                    f"do '{ctx.prefix}welcomeset ban msg list' for a list\n"
                     f"  Unban:\n"
                     f"    Enabled: {u['enabled']}\n"
                     f"    Channel: {unban_channel}\n"
-                    f"    Delete previous: {u['delete']}\n"
-                    f"    Messages: {len(u['messages'])}; do '{ctx.prefix}welcomeset unban msg list' for a list\n",
+                    f"    Mirrors: {Welcome.__mirror_list(guild, u['mirrors'], mention=False)}\n"
+                    f"    Delete previous: {u['delete']} (keeping {u['keep']})\n"
+                    f"    Messages: {len(u['messages'])}, in {u['order']} order; "
+                    f"do '{ctx.prefix}welcomeset unban msg list' for a list\n",
                     "Current Welcome Settings",
                 )
 
@@ -194,9 +420,9 @@ class Welcome(commands.Cog):
         """
 
         guild = ctx.guild
-        target_state = on_off if on_off is not None else not (await self.config.guild(guild).enabled())
+        target_state = on_off if on_off is not None else not self.__settings(guild)["enabled"]
 
-        await self.config.guild(guild).enabled.set(target_state)
+        await self.__set(guild, "enabled", value=target_state)
 
         await ctx.send(f"Welcome is now {ENABLED if target_state else DISABLED}.")
 
@@ -212,10 +438,273 @@ class Welcome(commands.Cog):
             return
 
         guild = ctx.guild
-        await self.config.guild(guild).channel.set(channel.id)
+        await self.__set(guild, "channel", value=channel.id)
 
         await ctx.send(f"I will now send event notices to {channel.mention}.")
 
+    @welcome.command(name="stats")
+    async def welcome_stats(self, ctx: commands.Context, days: int = 30) -> None:
+        """Get how many members joined, left, were banned, and were unbanned over the last `days` days.
+
+        Today counts as one of the days. Up to a year of history is kept.
+        """
+
+        history = self.__history(ctx.guild.id)
+        days = max(1, min(days, history.days - 1))
+        counts = {event: history.count(event, self.__date, days) for event in EVENTS}
+        period = "today" if days == 1 else f"the last {days} days"
+
+        if await ctx.embed_requested():
+            emb = discord.Embed(color=await ctx.embed_color(), title=f"Welcome Stats for {period.capitalize()}")
+            for event in EVENTS:
+                emb.add_field(name=f"{event.capitalize()}s", value=counts[event])
+            emb.add_field(name="Net change", value=f"{counts['join'] - counts['leave']:+}")
+
+            await ctx.send(embed=emb)
+        else:
+            msg = box(
+                "".join(f"  {event.capitalize()}s: {counts[event]}\n" for event in EVENTS)
+                + f"  Net change: {counts['join'] - counts['leave']:+}",
+                f"Welcome Stats for {period.capitalize()}",
+            )
+
+            await ctx.send(msg)
+
+    @welcome.group(name="queue", invoke_without_command=True)
+    async def welcome_queue(self, ctx: commands.Context) -> None:
+        """Get the state of this server's event queue."""
+
+        guild: discord.Guild = ctx.guild
+        queue = self.__queues.get(guild.id)
+        waits = sorted(self.__queue_waits[guild.id])
+
+        if waits:
+            p50 = waits[len(waits) // 2] * 1000
+            p99 = waits[min(len(waits) - 1, len(waits) * 99 // 100)] * 1000
+            latency = f"{p50:.1f} ms median, {p99:.1f} ms 99th percentile (last {len(waits)} events)"
+        else:
+            latency = "no events handled yet"
+
+        o = self.__settings(guild)["overload"]
+        shed = self.__shed[guild.id]
+        shed_counts = ", ".join(f"{shed[key]} {key}" for key in (*EVENTS, "whisper"))
+
+        msg = box(
+            f"  Queued events: {queue.qsize() if queue is not None else 0} / {self.__queue_size}\n"
+            f"  Dropped events: {self.__queue_dropped[guild.id]}\n"
+            f"  Queue wait: {latency}\n"
+            f"  Overload policy:\n"
+            f"    Enabled: {o['enabled']}\n"
+            f"    Threshold: {o['backlog']} queued events or {o['latency']} seconds behind\n"
+            f"    Action: {o['action']}\n"
+            f"    Priority: {' > '.join(o['priority'])}\n"
+            f"    Shed: {shed_counts}",
+            "Welcome Event Queue",
+        )
+
+        await ctx.send(msg)
+
+    @welcome_queue.command(name="size")
+    @checks.is_owner()
+    async def welcome_queue_size(self, ctx: commands.Context, size: int) -> None:
+        """Sets how many events each server may have waiting before new ones are dropped."""
+
+        if size < 1:
+            await ctx.send("The queue size must be at least 1.")
+            return
+
+        await self.config.queue_size.set(size)
+        self.__queue_size = size
+
+        await ctx.send(f"Each server's event queue will now hold up to {size} events.")
+
+    @welcome_queue.group(name="overload")
+    async def welcome_queue_overload(self, ctx: commands.Context) -> None:
+        """Change what happens when this server's events back up.
+
+        The server is overloaded once `backlog` events are waiting, or once the event being handled waited `latency`
+        seconds. The further past a threshold the queue is, the more events are shed, starting with the lowest
+        priority; the highest priority event is never shed. Depending on the action, shed events are dropped (they
+        are still counted), announced together in a digest, or announced without whispering the member.
+        """
+
+        pass
+
+    @welcome_queue_overload.command(name="toggle")
+    async def welcome_queue_overload_toggle(self, ctx: commands.Context, on_off: bool = None) -> None:
+        """Turns on/off shedding events when overloaded."""
+
+        guild: discord.Guild = ctx.guild
+        target_state = on_off if on_off is not None else not self.__settings(guild)["overload"]["enabled"]
+
+        await self.__set(guild, "overload", "enabled", value=target_state)
+
+        await ctx.send(f"Overload shedding is now {ENABLED if target_state else DISABLED}.")
+
+    @welcome_queue_overload.command(name="backlog")
+    async def welcome_queue_overload_backlog(self, ctx: commands.Context, events: int) -> None:
+        """Sets how many waiting events count as overloaded."""
+
+        if events < 1:
+            await ctx.send("The backlog threshold must be at least 1.")
+            return
+
+        await self.__set(ctx.guild, "overload", "backlog", value=events)
+
+        await ctx.send(f"This server will now count as overloaded once {events} events are waiting.")
+
+    @welcome_queue_overload.command(name="latency")
+    async def welcome_queue_overload_latency(self, ctx: commands.Context, seconds: int) -> None:
+        """Sets how many seconds behind counts as overloaded."""
+
+        if seconds < 1:
+            await ctx.send("The latency threshold must be at least 1 second.")
+            return
+
+        await self.__set(ctx.guild, "overload", "latency", value=seconds)
+
+        await ctx.send(f"This server will now count as overloaded once events are {seconds} seconds behind.")
+
+    @welcome_queue_overload.command(name="action")
+    async def welcome_queue_overload_action(self, ctx: commands.Context, action: OverloadAction) -> None:
+        """Sets what happens to shed events.
+
+        Allowed options are `drop`, `digest`, and `whispers`. `whispers` only sheds join whispers.
+        """
+
+        await self.__set(ctx.guild, "overload", "action", value=action.value)
+
+        await ctx.send(f"Shed events will now be handled with `{action.value}`.")
+
+    @welcome_queue_overload.command(name="priority")
+    async def welcome_queue_overload_priority(self, ctx: commands.Context, *events: str) -> None:
+        """Sets the order in which events are kept when overloaded, highest priority first.
+
+        All four events must be given, for example `ban unban join leave`.
+        """
+
+        priority = [e.lower() for e in events]
+        if sorted(priority) != sorted(EVENTS):
+            await ctx.send(f"Please give each of {humanize_list([f'`{e}`' for e in EVENTS])} exactly once.")
+            return
+
+        await self.__set(ctx.guild, "overload", "priority", value=priority)
+
+        await ctx.send(f"Events will now be kept in this order when overloaded: {' > '.join(priority)}.")
+
+    @welcome.group(name="trace", invoke_without_command=True)
+    @checks.is_owner()
+    async def welcome_trace(self, ctx: commands.Context) -> None:
+        """Get the state of event trace recording.
+
+        A trace holds anonymized membership events from every server, which can be replayed against the cog with
+        `python -m benchmarks.replay_welcome`.
+        """
+
+        recorder = self.__recorder
+        if recorder is None:
+            await ctx.send(f"No trace is being recorded. Traces are saved in `{self.__trace_dir()}`.")
+        else:
+            await ctx.send(
+                f"Recording to `{recorder.path}`: {recorder.count} events in {recorder.elapsed:.0f} seconds so far."
+            )
+
+    @welcome_trace.command(name="start")
+    @checks.is_owner()
+    async def welcome_trace_start(self, ctx: commands.Context, name: str = None) -> None:
+        """Start recording a trace of membership events from every server.
+
+        The trace is saved as `<name>.jsonl`; the name defaults to the current date and time.
+        """
+
+        if self.__recorder is not None:
+            await ctx.send(f"A trace is already being recorded to `{self.__recorder.path}`.")
+            return
+
+        if name is None:
+            name = discord.utils.utcnow().strftime("%Y%m%d-%H%M%S")
+        elif not name.replace("-", "").replace("_", "").isalnum():
+            await ctx.send("Trace names may only contain letters, numbers, dashes, and underscores.")
+            return
+
+        path = self.__trace_dir() / f"{name}.jsonl"
+        try:
+            self.__recorder = TraceRecorder(path)
+        except FileExistsError:
+            await ctx.send(f"A trace named `{name}` already exists; choose another name.")
+            return
+
+        await ctx.send(f"Recording membership events to `{self.__recorder.path}`.")
+
+    @welcome_trace.command(name="stop")
+    @checks.is_owner()
+    async def welcome_trace_stop(self, ctx: commands.Context) -> None:
+        """Stop recording the current trace."""
+
+        recorder = self.__recorder
+        if recorder is None:
+            await ctx.send("No trace is being recorded.")
+            return
+
+        self.__recorder = None
+        recorder.close()
+
+        await ctx.send(f"Recorded {recorder.count} events over {recorder.elapsed:.0f} seconds to `{recorder.path}`.")
+
+    @welcome.group(name="log")
+    async def welcome_log(self, ctx: commands.Context) -> None:
+        """Search this server's membership event log.
+
+        While the event log is on, every join, leave, ban, and unban is stored on the bot's machine with the member's
+        ID and account age, so recent events can be searched without going through the audit log.
+        """
+
+        pass
+
+    @welcome_log.command(name="toggle")
+    async def welcome_log_toggle(self, ctx: commands.Context, on_off: bool = None) -> None:
+        """Turns on/off logging this server's membership events."""
+
+        guild: discord.Guild = ctx.guild
+        target_state = on_off if on_off is not None else not self.__settings(guild)["eventlog"]
+
+        if target_state and self.__event_log is None:
+            await self.__open_event_log()
+
+        await self.__set(guild, "eventlog", value=target_state)
+
+        await ctx.send(f"The membership event log is now {ENABLED if target_state else DISABLED}.")
+
+    @welcome_log.command(name="recent")
+    async def welcome_log_recent(
+        self, ctx: commands.Context, event: str, within: commands.TimedeltaConverter(default_unit="minutes")
+    ) -> None:
+        """Lists the members with an event within a length of time.
+
+        For example, `recent join 10m` lists everyone who joined in the last 10 minutes.
+        """
+
+        event = event.lower()
+        if event not in EVENTS:
+            await ctx.send(f"The event must be one of {humanize_list([f'`{e}`' for e in EVENTS])}.")
+            return
+
+        await self.__search_log(ctx, event, within)
+
+    @welcome_log.command(name="young")
+    async def welcome_log_young(
+        self,
+        ctx: commands.Context,
+        younger_than: commands.TimedeltaConverter(default_unit="days"),
+        within: commands.TimedeltaConverter(default_unit="hours") = datetime.timedelta(days=1),
+    ) -> None:
+        """Lists the members with young accounts who joined within a length of time (a day, by default).
+
+        For example, `young 1d` lists accounts younger than one day which joined in the last day.
+        """
+
+        await self.__search_log(ctx, "join", within, younger_than=younger_than)
+
     @welcome.group(name="join")
     async def welcome_join(self, ctx: commands.Context) -> None:
         """Change settings for join notices."""
@@ -249,6 +738,33 @@ class Welcome(commands.Cog):
 
         await self.__toggledelete(ctx, on_off, "join")
 
+    @welcome_join.command(name="keep")
+    async def welcome_join_keep(self, ctx: commands.Context, number: int) -> None:
+        """Sets how many recent join notices each channel keeps when deletion of previous notices is on.
+
+        The default of 1 keeps only the newest notice.
+        """
+
+        await self.__set_keep(ctx, number, "join")
+
+    @welcome_join.group(name="mirror")
+    async def welcome_join_mirror(self, ctx: commands.Context) -> None:
+        """Change the extra channels join notices are also sent to."""
+
+        pass
+
+    @welcome_join_mirror.command(name="add")
+    async def welcome_join_mirror_add(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Adds a channel which join notices are also sent to."""
+
+        await self.__mirror_add(ctx, channel, "join")
+
+    @welcome_join_mirror.command(name="remove", aliases=["rm"])
+    async def welcome_join_mirror_remove(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Stops sending join notices to a mirror channel."""
+
+        await self.__mirror_remove(ctx, channel, "join")
+
     @welcome_join.group(name="whisper")
     async def welcome_join_whisper(self, ctx: commands.Context) -> None:
         """Change settings for join whispers."""
@@ -270,7 +786,7 @@ class Welcome(commands.Cog):
         whisper_type = choice.value
         channel = await self.__get_channel(ctx.guild, "join")
 
-        await self.config.guild(guild).join.whisper.state.set(whisper_type)
+        await self.__set(guild, "join", "whisper", "state", value=whisper_type)
 
         if choice == WhisperType.OFF:
             await ctx.send(f"I will no longer DM new members, and will send a notice to {channel.mention}.")
@@ -292,7 +808,10 @@ class Welcome(commands.Cog):
           `{server}` is the server
         """
 
-        await self.config.guild(ctx.guild).join.whisper.message.set(msg_format)
+        if not await self.__check_format(ctx, msg_format, WHISPER_FIELDS):
+            return
+
+        await self.__set(ctx.guild, "join", "whisper", "message", value=msg_format)
 
         await ctx.send("I will now use that message format when whispering new members, if whisper is enabled.")
 
@@ -333,6 +852,17 @@ class Welcome(commands.Cog):
 
         await self.__message_list(ctx, "join")
 
+    @welcome_join_message.command(name="order")
+    async def welcome_join_message_order(self, ctx: commands.Context, order: MessageOrder) -> None:
+        """Set the order in which join message formats are picked.
+
+        Options:
+          random - pick any format each time
+          shuffle - use every format once, in a random order, before using any of them again
+        """
+
+        await self.__set_order(ctx, order, "join")
+
     @welcome_join.command(name="botmessage", aliases=["botmsg"])
     async def welcome_join_botmessage(self, ctx: commands.Context, *, msg_format: str = None) -> None:
         """Sets the message format to use for join notices for bots.
@@ -348,13 +878,64 @@ class Welcome(commands.Cog):
           {bot.mention} beep boop.
         """
 
-        await self.config.guild(ctx.guild).join.bot.set(msg_format)
+        if msg_format is not None and not await self.__check_format(ctx, msg_format, NOTICE_FIELDS):
+            return
+
+        await self.__set(ctx.guild, "join", "bot", value=msg_format)
 
         if msg_format is not None:
             await ctx.send("Bot join message format set. I will now greet bots with that message.")
         else:
             await ctx.send("Bot join message format removed. I will now greet bots like normal members.")
 
+    @welcome_join.group(name="digest")
+    async def welcome_join_digest(self, ctx: commands.Context) -> None:
+        """Change settings for join digests.
+
+        When digests are on and at least `threshold` members join within `window` seconds, individual join notices
+        stop and the members who join are announced together in one digest message at the end of the window.
+        """
+
+        pass
+
+    @welcome_join_digest.command(name="toggle")
+    async def welcome_join_digest_toggle(self, ctx: commands.Context, on_off: bool = None) -> None:
+        """Turns join digests on or off.
+
+        If `on_off` is not provided, the state will be flipped.
+        """
+
+        guild: discord.Guild = ctx.guild
+        target_state = on_off if on_off is not None else not self.__settings(guild)["join"]["digest"]["enabled"]
+
+        await self.__set(guild, "join", "digest", "enabled", value=target_state)
+
+        await ctx.send(f"Join digests are now {ENABLED if target_state else DISABLED}.")
+
+    @welcome_join_digest.command(name="threshold")
+    async def welcome_join_digest_threshold(self, ctx: commands.Context, threshold: int) -> None:
+        """Sets how many joins within the window start a digest."""
+
+        if threshold < 2:
+            await ctx.send("The threshold must be at least 2.")
+            return
+
+        await self.__set(ctx.guild, "join", "digest", "threshold", value=threshold)
+
+        await ctx.send(f"Join digests will now start once {threshold} members join within the window.")
+
+    @welcome_join_digest.command(name="window")
+    async def welcome_join_digest_window(self, ctx: commands.Context, seconds: int) -> None:
+        """Sets the length of the digest window, in seconds."""
+
+        if seconds < 1:
+            await ctx.send("The window must be at least 1 second long.")
+            return
+
+        await self.__set(ctx.guild, "join", "digest", "window", value=seconds)
+
+        await ctx.send(f"Join digests will now collect joins for {seconds} seconds at a time.")
+
     @welcome.group(name="leave")
     async def welcome_leave(self, ctx: commands.Context) -> None:
         """Change settings for leave notices."""
@@ -388,6 +969,33 @@ class Welcome(commands.Cog):
 
         await self.__toggledelete(ctx, on_off, "leave")
 
+    @welcome_leave.command(name="keep")
+    async def welcome_leave_keep(self, ctx: commands.Context, number: int) -> None:
+        """Sets how many recent leave notices each channel keeps when deletion of previous notices is on.
+
+        The default of 1 keeps only the newest notice.
+        """
+
+        await self.__set_keep(ctx, number, "leave")
+
+    @welcome_leave.group(name="mirror")
+    async def welcome_leave_mirror(self, ctx: commands.Context) -> None:
+        """Change the extra channels leave notices are also sent to."""
+
+        pass
+
+    @welcome_leave_mirror.command(name="add")
+    async def welcome_leave_mirror_add(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Adds a channel which leave notices are also sent to."""
+
+        await self.__mirror_add(ctx, channel, "leave")
+
+    @welcome_leave_mirror.command(name="remove", aliases=["rm"])
+    async def welcome_leave_mirror_remove(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Stops sending leave notices to a mirror channel."""
+
+        await self.__mirror_remove(ctx, channel, "leave")
+
     @welcome_leave.group(name="message", aliases=["msg"])
     async def welcome_leave_message(self, ctx: commands.Context) -> None:
         """Manage leave message formats."""
@@ -425,6 +1033,17 @@ class Welcome(commands.Cog):
 
         await self.__message_list(ctx, "leave")
 
+    @welcome_leave_message.command(name="order")
+    async def welcome_leave_message_order(self, ctx: commands.Context, order: MessageOrder) -> None:
+        """Set the order in which leave message formats are picked.
+
+        Options:
+          random - pick any format each time
+          shuffle - use every format once, in a random order, before using any of them again
+        """
+
+        await self.__set_order(ctx, order, "leave")
+
     @welcome.group(name="ban")
     async def welcome_ban(self, ctx: commands.Context) -> None:
         """Change settings for ban notices."""
@@ -458,6 +1077,33 @@ class Welcome(commands.Cog):
 
         await self.__toggledelete(ctx, on_off, "ban")
 
+    @welcome_ban.command(name="keep")
+    async def welcome_ban_keep(self, ctx: commands.Context, number: int) -> None:
+        """Sets how many recent ban notices each channel keeps when deletion of previous notices is on.
+
+        The default of 1 keeps only the newest notice.
+        """
+
+        await self.__set_keep(ctx, number, "ban")
+
+    @welcome_ban.group(name="mirror")
+    async def welcome_ban_mirror(self, ctx: commands.Context) -> None:
+        """Change the extra channels ban notices are also sent to."""
+
+        pass
+
+    @welcome_ban_mirror.command(name="add")
+    async def welcome_ban_mirror_add(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Adds a channel which ban notices are also sent to."""
+
+        await self.__mirror_add(ctx, channel, "ban")
+
+    @welcome_ban_mirror.command(name="remove", aliases=["rm"])
+    async def welcome_ban_mirror_remove(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Stops sending ban notices to a mirror channel."""
+
+        await self.__mirror_remove(ctx, channel, "ban")
+
     @welcome_ban.group(name="message", aliases=["msg"])
     async def welcome_ban_message(self, ctx: commands.Context) -> None:
         """Manage ban message formats."""
@@ -495,6 +1141,17 @@ class Welcome(commands.Cog):
 
         await self.__message_list(ctx, "ban")
 
+    @welcome_ban_message.command(name="order")
+    async def welcome_ban_message_order(self, ctx: commands.Context, order: MessageOrder) -> None:
+        """Set the order in which ban message formats are picked.
+
+        Options:
+          random - pick any format each time
+          shuffle - use every format once, in a random order, before using any of them again
+        """
+
+        await self.__set_order(ctx, order, "ban")
+
     @welcome.group(name="unban")
     async def welcome_unban(self, ctx: commands.Context) -> None:
         """Change settings for unban notices."""
@@ -528,6 +1185,33 @@ class Welcome(commands.Cog):
 
         await self.__toggledelete(ctx, on_off, "unban")
 
+    @welcome_unban.command(name="keep")
+    async def welcome_unban_keep(self, ctx: commands.Context, number: int) -> None:
+        """Sets how many recent unban notices each channel keeps when deletion of previous notices is on.
+
+        The default of 1 keeps only the newest notice.
+        """
+
+        await self.__set_keep(ctx, number, "unban")
+
+    @welcome_unban.group(name="mirror")
+    async def welcome_unban_mirror(self, ctx: commands.Context) -> None:
+        """Change the extra channels unban notices are also sent to."""
+
+        pass
+
+    @welcome_unban_mirror.command(name="add")
+    async def welcome_unban_mirror_add(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Adds a channel which unban notices are also sent to."""
+
+        await self.__mirror_add(ctx, channel, "unban")
+
+    @welcome_unban_mirror.command(name="remove", aliases=["rm"])
+    async def welcome_unban_mirror_remove(self, ctx: commands.Context, channel: discord.TextChannel) -> None:
+        """Stops sending unban notices to a mirror channel."""
+
+        await self.__mirror_remove(ctx, channel, "unban")
+
     @welcome_unban.group(name="message", aliases=["msg"])
     async def welcome_unban_message(self, ctx: commands.Context) -> None:
         """Manage unban message formats."""
@@ -565,124 +1249,278 @@ class Welcome(commands.Cog):
 
         await self.__message_list(ctx, "unban")
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member) -> None:
-        """Listens for member joins."""
+    @welcome_unban_message.command(name="order")
+    async def welcome_unban_message_order(self, ctx: commands.Context, order: MessageOrder) -> None:
+        """Set the order in which unban message formats are picked.
 
-        guild: discord.Guild = member.guild
-        guild_settings = self.config.guild(guild)
+        Options:
+          random - pick any format each time
+          shuffle - use every format once, in a random order, before using any of them again
+        """
 
-        if await guild_settings.enabled() and await guild_settings.join.enabled():
-            # join notice should be sent
-            message_format: Optional[str] = None
-            if member.bot:
-                # bot
-                message_format = await guild_settings.join.bot()
+        await self.__set_order(ctx, order, "unban")
 
-            else:
-                whisper_type: str = await guild_settings.join.whisper.state()
-                if whisper_type != "off":
-                    try:
-                        await self.__dm_user(member)
-                    except WhisperError:
-                        if whisper_type == "fall":
-                            message_format = await self.config.guild(member.guild).join.whisper.message()
-                            await self.__handle_event(guild, member, "join", message_format=message_format)
-                            return
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member) -> None:
+        """Listens for member joins."""
 
-                    if whisper_type == "only" or whisper_type == "fall":
-                        # we're done here
-                        return
+        self.__observe("join", member.guild, member)
 
-            await self.__handle_event(guild, member, "join", message_format=message_format)
+        self.__enqueue(member.guild, self.__handle_join, member)
 
     @commands.Cog.listener()
     async def on_member_remove(self, member: discord.Member) -> None:
         """Listens for member leaves."""
 
-        await self.__handle_event(member.guild, member, "leave")
+        self.__observe("leave", member.guild, member)
+
+        self.__hold_leave(member)
 
     @commands.Cog.listener()
     async def on_member_ban(self, guild: discord.Guild, member: discord.Member) -> None:
         """Listens for user bans."""
 
-        await self.__handle_event(guild, member, "ban")
+        self.__observe("ban", guild, member)
+
+        self.__note_ban(guild, member)
+        self.__enqueue(guild, self.__handle_event, guild, member, "ban")
 
     @commands.Cog.listener()
     async def on_member_unban(self, guild: discord.Guild, user: discord.User) -> None:
         """Listens for user unbans."""
 
-        await self.__handle_event(guild, user, "unban")
+        self.__observe("unban", guild, user)
 
-    #
-    # concrete handlers for settings changes and events
-    #
+        self.__enqueue(guild, self.__handle_event, guild, user, "unban")
 
-    async def __toggle(self, ctx: commands.Context, on_off: bool, event: str) -> None:
-        """Handler for setting toggles."""
+    @commands.Cog.listener()
+    async def on_guild_update(self, _, after: discord.Guild) -> None:
+        """Listens for server updates to refresh the server's safe model and notice channels."""
 
-        guild: discord.Guild = ctx.guild
-        target_state = on_off if on_off is not None else not (await self.config.guild(guild).get_attr(event).enabled())
+        SafeGuild.forget(after.id)
+        self.__channels.pop(after.id, None)
 
-        await self.config.guild(guild).get_attr(event).enabled.set(target_state)
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        """Listens for the bot leaving a server to drop the server's safe model and notice channels."""
 
-        await ctx.send(f"{event.capitalize()} notices are now {ENABLED if target_state else DISABLED}.")
+        SafeGuild.forget(guild.id)
+        self.__channels.pop(guild.id, None)
 
-    async def __set_channel(self, ctx: commands.Context, channel: discord.TextChannel, event: str) -> None:
-        """Handler for setting channels."""
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel) -> None:
+        """Listens for channel creations, which may provide a better notice channel."""
 
-        guild: discord.Guild = ctx.guild
+        self.__channels.pop(channel.guild.id, None)
 
-        store_this = channel.id if channel is not None else None
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, _, after: discord.abc.GuildChannel) -> None:
+        """Listens for channel updates, which may change where the bot can speak."""
 
-        await self.config.guild(guild).get_attr(event).channel.set(store_this)
+        self.__channels.pop(after.guild.id, None)
 
-        if store_this is not None:
-            await ctx.send(f"I will now send {event} notices to {channel.mention}.")
-        else:
-            default_channel = await self.__get_channel(guild, "default")
-            await ctx.send(f"I will now send {event} messages to the default channel, {default_channel.mention}.")
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel) -> None:
+        """Listens for channel deletions, which may remove a notice channel."""
+
+        self.__channels.pop(channel.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(self, _, after: discord.Role) -> None:
+        """Listens for role updates, which may change where the bot can speak."""
+
+        self.__channels.pop(after.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        """Listens for role deletions, which may change where the bot can speak."""
+
+        self.__channels.pop(role.guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, _, after: discord.Member) -> None:
+        """Listens for updates to the bot's own roles, which may change where it can speak."""
+
+        if after.id == after.guild.me.id:
+            self.__channels.pop(after.guild.id, None)
+
+    #
+    # concrete handlers for settings changes and events
+    #
+
+    async def __search_log(
+        self,
+        ctx: commands.Context,
+        event: str,
+        within: datetime.timedelta,
+        *,
+        younger_than: Optional[datetime.timedelta] = None,
+    ) -> None:
+        """Handler for event log searches."""
+
+        guild: discord.Guild = ctx.guild
+        if self.__event_log is None or not self.__settings(guild)["eventlog"]:
+            await ctx.send(f"The event log is off; turn it on with `{ctx.prefix}welcomeset log toggle`.")
+            return
+
+        now = time.time()
+        since = now - within.total_seconds()
+        created_after = now - younger_than.total_seconds() if younger_than is not None else None
+        rows = await self.__event_log.query(guild.id, event, since, created_after=created_after)
+
+        described = f"{event} events within {humanize_timedelta(timedelta=within)}"
+        if younger_than is not None:
+            described += f" from accounts younger than {humanize_timedelta(timedelta=younger_than)}"
+
+        if not rows:
+            await ctx.send(f"There have been no {described}.")
+            return
+
+        lines = [
+            f"<@{member_id}> (`{member_id}`) <t:{int(at)}:R>, account age "
+            f"{humanize_timedelta(seconds=max(int(at - created), 1))}"
+            for member_id, created, at in rows
+        ]
+        text = f"{len(rows)} {described}, newest first:\n" + "\n".join(lines)
+
+        for page in pagify(text):
+            await ctx.send(page, allowed_mentions=discord.AllowedMentions.none())
+
+    async def __toggle(self, ctx: commands.Context, on_off: bool, event: str) -> None:
+        """Handler for setting toggles."""
+
+        guild: discord.Guild = ctx.guild
+        target_state = on_off if on_off is not None else not self.__settings(guild)[event]["enabled"]
+
+        await self.__set(guild, event, "enabled", value=target_state)
+
+        await ctx.send(f"{event.capitalize()} notices are now {ENABLED if target_state else DISABLED}.")
+
+    async def __set_channel(self, ctx: commands.Context, channel: discord.TextChannel, event: str) -> None:
+        """Handler for setting channels."""
+
+        guild: discord.Guild = ctx.guild
+
+        store_this = channel.id if channel is not None else None
+
+        await self.__set(guild, event, "channel", value=store_this)
+
+        if store_this is not None:
+            await ctx.send(f"I will now send {event} notices to {channel.mention}.")
+        else:
+            default_channel = await self.__get_channel(guild, "default")
+            await ctx.send(f"I will now send {event} messages to the default channel, {default_channel.mention}.")
 
     async def __toggledelete(self, ctx: commands.Context, on_off: bool, event: str) -> None:
         """Handler for setting delete toggles."""
 
         guild: discord.Guild = ctx.guild
-        target_state = on_off if on_off is not None else not (await self.config.guild(guild).get_attr(event).delete())
+        target_state = on_off if on_off is not None else not self.__settings(guild)[event]["delete"]
 
-        await self.config.guild(guild).get_attr(event).delete.set(target_state)
+        await self.__set(guild, event, "delete", value=target_state)
 
         await ctx.send(f"Deletion of previous {event} notice is now {ENABLED if target_state else DISABLED}")
 
+    async def __set_keep(self, ctx: commands.Context, number: int, event: str) -> None:
+        """Handler for setting how many notices are kept."""
+
+        if not 1 <= number <= 100:
+            await ctx.send("The number of notices to keep must be between 1 and 100.")
+            return
+
+        guild: discord.Guild = ctx.guild
+        await self.__set(guild, event, "keep", value=number)
+
+        await ctx.send(
+            f"When deletion of previous {event} notices is on, I will now keep the newest {number} in each channel."
+        )
+
+    async def __mirror_add(self, ctx: commands.Context, channel: discord.TextChannel, event: str) -> None:
+        """Handler for adding mirror channels."""
+
+        guild: discord.Guild = ctx.guild
+        mirrors: List[int] = self.__settings(guild)[event]["mirrors"]
+
+        if channel.id in mirrors:
+            await ctx.send(f"{event.capitalize()} notices are already mirrored to {channel.mention}.")
+            return
+
+        if len(mirrors) >= self.max_mirrors:
+            await ctx.send(f"{event.capitalize()} notices can be mirrored to at most {self.max_mirrors} channels.")
+            return
+
+        await self.__set(guild, event, "mirrors", value=mirrors + [channel.id])
+
+        await ctx.send(f"I will now also send {event} notices to {channel.mention}.")
+
+    async def __mirror_remove(self, ctx: commands.Context, channel: discord.TextChannel, event: str) -> None:
+        """Handler for removing mirror channels."""
+
+        guild: discord.Guild = ctx.guild
+        mirrors: List[int] = self.__settings(guild)[event]["mirrors"]
+
+        if channel.id not in mirrors:
+            await ctx.send(f"{event.capitalize()} notices are not mirrored to {channel.mention}.")
+            return
+
+        await self.__set(guild, event, "mirrors", value=[m for m in mirrors if m != channel.id])
+
+        await ctx.send(f"I will no longer send {event} notices to {channel.mention}.")
+
+    async def __set_order(self, ctx: commands.Context, order: MessageOrder, event: str) -> None:
+        """Handler for setting message format orders."""
+
+        guild: discord.Guild = ctx.guild
+        await self.__set(guild, event, "order", value=order.value)
+
+        await ctx.send(f"I will now pick {event} message formats in {order.value} order.")
+
     async def __message_add(self, ctx: commands.Context, msg_format: str, event: str) -> None:
         """Handler for adding message formats."""
 
         guild: discord.Guild = ctx.guild
 
-        async with self.config.guild(guild).get_attr(event).messages() as messages:
-            messages.append(msg_format)
+        if not await self.__check_format(ctx, msg_format, NOTICE_FIELDS):
+            return
+
+        messages = self.__settings(guild)[event]["messages"] + [msg_format]
+        await self.__set(guild, event, "messages", value=messages)
 
         await ctx.send(f"New message format for {event} notices added.")
 
+    @staticmethod
+    async def __check_format(ctx: commands.Context, msg_format: str, allowed: FrozenSet[str]) -> bool:
+        """Checks that msg_format is a usable message format, telling the user why if it is not."""
+
+        try:
+            compile_template(msg_format, allowed)
+        except TemplateError as e:
+            await ctx.send(f"I can't use that message format. {e.message}")
+            return False
+
+        return True
+
     async def __message_delete(self, ctx: commands.Context, event: str) -> None:
         """Handler for deleting message formats."""
 
         guild: discord.Guild = ctx.guild
 
-        async with self.config.guild(guild).get_attr(event).messages() as messages:
-            if len(messages) == 1:
-                await ctx.send(f"I only have one {event} message format, so I can't let you delete it.")
-                return
+        messages = list(self.__settings(guild)[event]["messages"])
+        if len(messages) == 1:
+            await ctx.send(f"I only have one {event} message format, so I can't let you delete it.")
+            return
 
-            await self.__message_list(ctx, event)
-            await ctx.send(f"Please enter the number of the {event} message format you wish to delete.")
+        await self.__message_list(ctx, event)
+        await ctx.send(f"Please enter the number of the {event} message format you wish to delete.")
 
-            try:
-                num = await Welcome.__get_number_input(ctx, len(messages))
-            except asyncio.TimeoutError:
-                await ctx.send(f"Okay, I won't remove any of the {event} message formats.")
-                return
-            else:
-                removed = messages.pop(num - 1)
+        try:
+            num = await Welcome.__get_number_input(ctx, len(messages))
+        except asyncio.TimeoutError:
+            await ctx.send(f"Okay, I won't remove any of the {event} message formats.")
+            return
+
+        removed = messages.pop(num - 1)
+        await self.__set(guild, event, "messages", value=messages)
 
         await ctx.send(f"Done. This {event} message format was deleted:\n`{removed}`")
 
@@ -692,38 +1530,319 @@ class Welcome(commands.Cog):
         guild: discord.Guild = ctx.guild
 
         msg = f"{event.capitalize()} message formats:\n"
-        messages = await self.config.guild(guild).get_attr(event).messages()
+        messages = self.__settings(guild)[event]["messages"]
         for n, m in enumerate(messages, start=1):
             msg += f"  {n}. {m}\n"
 
         for page in pagify(msg, shorten_by=20):
             await ctx.send(box(page))
 
+    async def __handle_join(self, member: discord.Member) -> None:
+        """Handler for member joins, which may whisper the member instead of or as well as sending a notice."""
+
+        guild: discord.Guild = member.guild
+        settings = self.__settings(guild)
+
+        if settings["enabled"] and settings["join"]["enabled"]:
+            # join notice should be sent
+            message_format: Optional[str] = None
+            if member.bot:
+                # bot
+                message_format = settings["join"]["bot"]
+
+            else:
+                whisper_type: str = settings["join"]["whisper"]["state"]
+                if whisper_type != "off" and self.__shedding(guild, "join", OverloadAction.WHISPERS):
+                    # too far behind to be whispering; "both" and "fall" still get the notice
+                    self.__shed[guild.id]["whisper"] += 1
+                    if whisper_type == "only":
+                        return
+
+                elif whisper_type != "off":
+                    # the whisper is sent in the background, so the notice does not wait on it
+                    self.__queue_whisper(member, fallback=whisper_type == "fall")
+
+                    if whisper_type == "only" or whisper_type == "fall":
+                        # we're done here; a failed "fall" whisper queues its own notice
+                        return
+
+            await self.__handle_event(guild, member, "join", message_format=message_format)
+
     async def __handle_event(
         self, guild: discord.guild, user: Union[discord.Member, discord.User], event: str, *, message_format=None
     ) -> None:
         """Handler for actual events."""
 
-        guild_settings = self.config.guild(guild)
+        guild_settings = self.__settings(guild)
 
         # always increment, even if we aren't sending a notice
-        await self.__increment_count(guild, event)
+        self.__increment_count(guild, event)
 
-        if await guild_settings.enabled():
-            settings = await guild_settings.get_attr(event).all()
+        if guild_settings["enabled"]:
+            settings = guild_settings[event]
             if settings["enabled"]:
                 # notices for this event are enabled
 
-                if settings["delete"] and settings["last"] is not None:
-                    # we need to delete the previous message
-                    await self.__delete_message(guild, settings["last"], event)
-                    # regardless of success, remove reference to that message
-                    await guild_settings.get_attr(event).last.set(None)
+                if self.__shedding(guild, event, OverloadAction.DROP):
+                    self.__shed[guild.id][event] += 1
+                    return
+
+                if self.__shedding(guild, event, OverloadAction.DIGEST):
+                    self.__shed[guild.id][event] += 1
+                    self.__add_to_digest(guild, event, user)
+                    return
+
+                if event == "join" and self.__in_join_burst(guild):
+                    # the notice will go out with the rest of the burst
+                    self.__add_to_digest(guild, event, user)
+                    return
+
+                targets = await self.__get_targets(guild, event)
+                notices = await self.__delete_previous(guild, event, targets)
+
+                # send a notice to each channel
+                new_messages = await self.__send_notice(guild, user, event, targets, message_format=message_format)
+                # store them for (possible) deletion later
+                await self.__record_notices(guild, event, notices, new_messages)
+
+    def __enqueue(self, guild: discord.Guild, handler: Callable[..., Any], *args: Any) -> None:
+        """Queues handler(*args) to be run by guild's event worker, starting the worker if needed.
+
+        Events for a single guild are handled one at a time in the order they arrive; each guild has its own worker,
+        so separate guilds are handled in parallel.
+        """
+
+        queue = self.__queues.get(guild.id)
+        if queue is None:
+            queue = self.__queues[guild.id] = asyncio.Queue()
+            self.__workers[guild.id] = asyncio.create_task(self.__work(guild.id, queue))
+
+        if queue.qsize() >= self.__queue_size:
+            self.__queue_dropped[guild.id] += 1
+            log.warning(f"Dropped event for server ID {guild.id}: event queue is full")
+            return
+
+        queue.put_nowait((time.monotonic(), handler, args))
+
+    async def __work(self, guild_id: int, queue: asyncio.Queue) -> None:
+        """Handles the events in queue, one at a time, forever."""
+
+        while True:
+            queued_at, handler, args = await queue.get()
+            wait = time.monotonic() - queued_at
+            self.__queue_waits[guild_id].append(wait)
+            self.__overload_levels[guild_id] = self.__overload_level(guild_id, queue.qsize(), wait)
+
+            try:
+                await handler(*args)
+            except Exception:
+                log.exception(f"Failed to handle event for server ID {guild_id}")
+            finally:
+                queue.task_done()
+
+    def __overload_level(self, guild_id: int, backlog: int, wait: float) -> int:
+        """Gets how many times over its overload thresholds a guild is; 0 if it is keeping up or has no policy."""
+
+        settings = self.__cache.get(guild_id)
+        if settings is None or not settings["overload"]["enabled"]:
+            return 0
+
+        overload = settings["overload"]
+        return max(backlog // overload["backlog"], int(wait // overload["latency"]))
+
+    def __shedding(self, guild: discord.Guild, event: str, action: OverloadAction) -> bool:
+        """Indicates whether the event being handled should be shed with action.
+
+        Each level of overload sheds one more event, lowest priority first; the highest priority event never is.
+        """
+
+        level = self.__overload_levels.get(guild.id, 0)
+        if not level:
+            return False
+
+        overload = self.__settings(guild)["overload"]
+        if overload["action"] != action.value:
+            return False
+
+        rank = overload["priority"].index(event)
+        return rank > 0 and rank >= len(EVENTS) - level
+
+    async def __delete_previous(
+        self, guild: discord.Guild, event: str, targets: List[discord.TextChannel]
+    ) -> List[List[Optional[int]]]:
+        """Deletes all but the newest keep - 1 notices for event in each of targets, if deletion is on, to make room
+        for new ones. Notices in channels which are no longer targets are all deleted.
+
+        Returns the notices which are left, to be passed on to __record_notices.
+        """
+
+        settings = self.__settings(guild)[event]
+        notices: List[List[Optional[int]]] = self.__state(guild)[event]["notices"]
+        if not settings["delete"]:
+            return notices
+
+        expired, remaining = Welcome.__split_notices(notices, settings["keep"] - 1, {c.id for c in targets})
+        if expired:
+            await self.__delete_messages(guild, event, expired)
+
+        # regardless of success, forget the deleted messages
+        return remaining
+
+    async def __record_notices(
+        self, guild: discord.Guild, event: str, notices: List[List[Optional[int]]], messages: List[discord.Message]
+    ) -> None:
+        """Saves the notices left for event plus the newly sent messages, forgetting any beyond the number to keep.
+
+        The messages make up one new notice in each channel they were sent to, however many pages it took. This is the
+        only write to Config made while handling a notice.
+        """
+
+        sent: Dict[int, List[int]] = {}
+        for message in messages:
+            sent.setdefault(message.channel.id, []).append(message.id)
+
+        keep = self.__settings(guild)[event]["keep"]
+        new_notices = [[channel_id, *message_ids] for channel_id, message_ids in sent.items()]
+        _, notices = Welcome.__split_notices(notices + new_notices, keep)
+
+        if notices != self.__state(guild)[event]["notices"]:
+            await self.__set_state(guild, event, "notices", value=notices)
+
+    def __in_join_burst(self, guild: discord.Guild) -> bool:
+        """Records a join notice and indicates whether it is part of a burst which should be digested."""
+
+        digest = self.__settings(guild)["join"]["digest"]
+        if not digest["enabled"]:
+            return False
+
+        # joins are recorded even while a digest is collecting, so that a burst which outlasts one digest carries
+        # straight on into the next
+        now = time.monotonic()
+        recent = self.__recent_joins[guild.id]
+        recent.append(now)
+        while recent and now - recent[0] > digest["window"]:
+            recent.popleft()
+
+        # a digest may already be collecting
+        return (guild.id, "join") in self.__digest_buffers or len(recent) >= digest["threshold"]
+
+    def __add_to_digest(self, guild: discord.Guild, event: str, member: Union[discord.Member, discord.User]) -> None:
+        """Adds member to the pending digest of event for guild, starting one if needed.
+
+        Every digest lasts as long as the join digest window.
+        """
 
-                # send a notice to the channel
-                new_message = await self.__send_notice(guild, user, event, message_format=message_format)
-                # store it for (possible) deletion later
-                await guild_settings.get_attr(event).last.set(new_message and new_message.id)
+        key = (guild.id, event)
+        if key not in self.__digest_buffers:
+            self.__digest_buffers[key] = []
+            window = self.__settings(guild)["join"]["digest"]["window"]
+            self.__digest_tasks[key] = asyncio.create_task(self.__flush_digest(guild, event, window))
+
+        self.__digest_buffers[key].append(member)
+
+    async def __flush_digest(self, guild: discord.Guild, event: str, delay: float) -> None:
+        """Waits out the digest window, then sends the digest for everyone added during it.
+
+        Cancelling this cuts the window short; the digest is still sent.
+        """
+
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            members = self.__digest_buffers.pop((guild.id, event), [])
+            self.__digest_tasks.pop((guild.id, event), None)
+            if members:
+                # sending goes through the queue so it is ordered with the guild's other notices
+                self.__enqueue(guild, self.__send_digest, guild, event, members)
+
+    def __observe(self, event: str, guild: discord.Guild, user: Union[discord.Member, discord.User]) -> None:
+        """Passes a membership event to the trace recorder and the event log, where they are on."""
+
+        if self.__recorder is not None:
+            self.__recorder.record(event, guild, user)
+
+        if self.__event_log is not None and self.__settings(guild)["eventlog"]:
+            self.__event_log.add(guild.id, event, user.id, user.created_at.timestamp(), time.time())
+
+    async def __open_event_log(self) -> None:
+        """Opens the event log database."""
+
+        event_log = EventLog(self.__event_log_path())
+        await event_log.open()
+        self.__event_log = event_log
+
+    def __event_log_path(self) -> Path:
+        """Gets the path of the event log database."""
+
+        return cog_data_path(self) / "events.db"
+
+    def __hold_leave(self, member: discord.Member) -> None:
+        """Queues a leave, holding it back for the ban window first if a ban for the same member would replace it.
+
+        Discord reports a ban as both a removal and a ban, so without this every ban would be announced twice.
+        """
+
+        guild: discord.Guild = member.guild
+        settings = self.__settings(guild)
+        if not (settings["enabled"] and settings["ban"]["enabled"]):
+            # nothing would be announced for the ban, so the leave stands on its own
+            self.__enqueue(guild, self.__handle_event, guild, member, "leave")
+            return
+
+        key = (guild.id, member.id)
+        banned_at = self.__recent_bans.pop(key, None)
+        if banned_at is not None and time.monotonic() - banned_at <= self.ban_leave_window:
+            # the ban came first and has already been announced
+            return
+
+        previous = self.__held_leaves.pop(key, None)
+        if previous is not None:
+            # they rejoined and left again within the window; the earlier leave has waited long enough
+            previous[1].cancel()
+            self.__enqueue(guild, self.__handle_event, guild, previous[0], "leave")
+
+        timer = asyncio.get_running_loop().call_later(self.ban_leave_window, self.__release_leave, key)
+        self.__held_leaves[key] = (member, timer)
+
+    def __release_leave(self, key: Tuple[int, int]) -> None:
+        """Queues a held leave once the ban window has passed without a ban."""
+
+        member, _ = self.__held_leaves.pop(key)
+        self.__enqueue(member.guild, self.__handle_event, member.guild, member, "leave")
+
+    def __note_ban(self, guild: discord.Guild, user: Union[discord.Member, discord.User]) -> None:
+        """Drops any held leave for a banned user, or remembers the ban in case the leave is still to come."""
+
+        key = (guild.id, user.id)
+        held = self.__held_leaves.pop(key, None)
+        if held is not None:
+            held[1].cancel()
+            return
+
+        now = time.monotonic()
+        # forget bans whose window has passed; they are in the order they happened
+        for old_key, banned_at in list(self.__recent_bans.items()):
+            if now - banned_at <= self.ban_leave_window:
+                break
+            del self.__recent_bans[old_key]
+
+        self.__recent_bans[key] = now
+
+    async def __send_digest(self, guild: discord.Guild, event: str, members: List[discord.Member]) -> None:
+        """Sends a single notice announcing event for all of members."""
+
+        targets = await self.__get_targets(guild, event)
+        notices = await self.__delete_previous(guild, event, targets)
+
+        count = len(members)
+        verb = DIGEST_VERBS[event][count != 1]
+        text = f"{count} member{'s' if count != 1 else ''} {verb}: {humanize_list([m.mention for m in members])}"
+
+        new_messages = await self.__send_to_targets(
+            guild, f"{event} digest", targets, list(pagify(text, delims=[", "]))
+        )
+
+        await self.__record_notices(guild, event, notices, new_messages)
 
     async def __get_channel(self, guild: discord.Guild, event: str) -> discord.TextChannel:
         """Gets the best text channel to use for event notices.
@@ -732,20 +1851,45 @@ class Welcome(commands.Cog):
         1. User-defined channel
         2. Guild's system channel (if bot can speak in it)
         3. First channel that the bot can speak in
+
+        The result is cached until a channel, role, permission, or Welcome channel setting changes.
         """
 
+        channels = self.__channels[guild.id]
+        if event not in channels:
+            channels[event] = self.__resolve_channel(guild, event)
+
+        return channels[event]
+
+    async def __get_targets(self, guild: discord.Guild, event: str) -> List[discord.TextChannel]:
+        """Gets every channel event notices go to: the one from __get_channel, then any mirrors which still exist."""
+
+        channel = await self.__get_channel(guild, event)
+        targets = [channel] if channel is not None else []
+
+        for channel_id in self.__settings(guild)[event]["mirrors"]:
+            mirror = guild.get_channel(channel_id)
+            if mirror is not None and mirror not in targets:
+                targets.append(mirror)
+
+        return targets
+
+    def __resolve_channel(self, guild: discord.Guild, event: str) -> Optional[discord.TextChannel]:
+        """Works out the channel for __get_channel."""
+
         channel = None
+        settings = self.__settings(guild)
 
         if event == "default":
-            channel_id: int = await self.config.guild(guild).channel()
+            channel_id: int = settings["channel"]
         else:
-            channel_id = await self.config.guild(guild).get_attr(event).channel()
+            channel_id = settings[event]["channel"]
 
         if channel_id is not None:
             channel = guild.get_channel(channel_id)
 
         if channel is None or not Welcome.__can_speak_in(channel):
-            channel = guild.get_channel(await self.config.guild(guild).channel())
+            channel = guild.get_channel(settings["channel"])
 
         if channel is None or not Welcome.__can_speak_in(channel):
             channel = guild.system_channel
@@ -758,96 +1902,367 @@ class Welcome(commands.Cog):
 
         return channel
 
-    async def __delete_message(self, guild: discord.Guild, message_id: int, event: str) -> None:
-        """Attempts to delete the message with the given ID."""
+    async def __delete_messages(self, guild: discord.Guild, event: str, notices: List[List[Optional[int]]]) -> None:
+        """Attempts to delete event's notices with the given channel and message IDs.
+
+        Messages are deleted without fetching them first; where possible, each channel's messages are bulk deleted.
+        """
+
+        by_channel: Dict[Optional[int], List[int]] = defaultdict(list)
+        for channel_id, *message_ids in notices:
+            by_channel[channel_id].extend(message_ids)
+
+        # Discord refuses to bulk delete messages older than this
+        bulk_cutoff = discord.utils.utcnow() - datetime.timedelta(days=14) + datetime.timedelta(minutes=1)
+
+        for channel_id, message_ids in by_channel.items():
+            if channel_id is None:
+                # recorded before notices were stored with their channel; it can only be in the current one
+                channel: Optional[discord.TextChannel] = await self.__get_channel(guild, event)
+            else:
+                channel = guild.get_channel(channel_id)
+
+            if channel is None:
+                continue
+
+            messages = [channel.get_partial_message(message_id) for message_id in message_ids]
+            singles = messages
+            if len(messages) > 1 and channel.permissions_for(guild.me).manage_messages:
+                bulk = [m for m in messages if m.created_at > bulk_cutoff]
+                singles = [m for m in messages if m.created_at <= bulk_cutoff]
+                for i in range(0, len(bulk), 100):
+                    try:
+                        await channel.delete_messages(bulk[i : i + 100])
+                    except discord.DiscordException:
+                        log.warning(f"Failed to bulk delete messages in channel ID {channel_id} (server ID {guild.id})")
+                        singles.extend(bulk[i : i + 100])
+
+            for message in singles:
+                await Welcome.__delete_message(message)
+
+    @staticmethod
+    async def __delete_message(message: discord.PartialMessage) -> None:
+        """Attempts to delete the message."""
 
         try:
-            await (await (await self.__get_channel(guild, event)).fetch_message(message_id)).delete()
+            await message.delete()
         except discord.NotFound:
-            log.warning("Failed to delete message (ID {message_id}): not found")
+            log.warning(f"Failed to delete message (ID {message.id}): not found")
         except discord.Forbidden:
-            log.warning("Failed to delete message (ID {message_id}): insufficient permissions")
+            log.warning(f"Failed to delete message (ID {message.id}): insufficient permissions")
         except discord.DiscordException:
-            log.warning("Failed to delete message (ID {message_id})")
+            log.warning(f"Failed to delete message (ID {message.id})")
 
     async def __send_notice(
-        self, guild: discord.guild, user: Union[discord.Member, discord.User], event: str, *, message_format=None
-    ) -> Optional[discord.Message]:
-        """Sends the notice for the event."""
+        self,
+        guild: discord.guild,
+        user: Union[discord.Member, discord.User],
+        event: str,
+        targets: List[discord.TextChannel],
+        *,
+        message_format=None,
+    ) -> List[discord.Message]:
+        """Sends the notice for the event to each of targets."""
+
+        format_str = message_format or self.__message_pool(guild, event).pick()
 
-        format_str = message_format or await self.__get_random_message_format(guild, event)
+        try:
+            template = compile_template(format_str, NOTICE_FIELDS)
+        except TemplateError as e:
+            log.error(f"Failed to use {event} message format (server ID {guild.id}): {e.message}")
+            return []
+
+        count = self.__state(guild)[event]["counter"]
+
+        # only the fields which the template actually uses get built
+        context = {
+            "member": lambda: SafeMember(user),
+            "bot": lambda: SafeMember(user),
+            "server": lambda: SafeGuild(guild),
+            "count": lambda: count or "",
+            "plural": lambda: "s" if count and count != 1 else "",
+            "roles": lambda: Welcome.__role_list(user),
+        }
 
-        count = await self.config.guild(guild).get_attr(event).counter()
-        plural = ""
-        if count and count != 1:
-            plural = "s"
+        try:
+            content = template.render(context)
+        except (AttributeError, IndexError, KeyError, TypeError, ValueError):
+            log.error(f"Failed to fill in {event} message format (server ID {guild.id})")
+            return []
 
-        channel = await self.__get_channel(guild, event)
+        return await self.__send_to_targets(guild, f"{event} message", targets, [content])
+
+    async def __send_to_targets(
+        self, guild: discord.Guild, what: str, targets: List[discord.TextChannel], pages: List[str]
+    ) -> List[discord.Message]:
+        """Sends pages to each of targets, a few channels at a time, and returns the messages which were sent.
+
+        A channel which fails is logged and skipped without holding up the others.
+        """
+
+        semaphore = asyncio.Semaphore(self.notice_concurrency)
+
+        async def send(channel: discord.TextChannel) -> List[discord.Message]:
+            sent: List[discord.Message] = []
+            async with semaphore:
+                try:
+                    for page in pages:
+                        sent.append(await channel.send(page))
+                except discord.Forbidden:
+                    log.error(
+                        f"Failed to send {what} to channel ID {channel.id} (server ID {guild.id}): "
+                        "insufficient permissions"
+                    )
+                except discord.DiscordException:
+                    log.error(f"Failed to send {what} to channel ID {channel.id} (server ID {guild.id})")
+            return sent
+
+        if len(targets) == 1:
+            # the common case needs no gathering
+            return await send(targets[0])
+
+        results = await asyncio.gather(*(send(channel) for channel in targets))
+        return [message for sent in results for message in sent]
+
+    def __message_pool(self, guild: discord.Guild, event: str) -> MessagePool:
+        """Gets the pool of message formats for event, building it if the formats have changed."""
+
+        pool = self.__pools.get((guild.id, event))
+        if pool is None:
+            settings = self.__settings(guild)[event]
+            pool = self.__pools[(guild.id, event)] = MessagePool(settings["messages"], MessageOrder(settings["order"]))
+
+        return pool
+
+    def __increment_count(self, guild: discord.Guild, event: str) -> None:
+        """Increments the counter for <event>s today. Handles date changes.
+
+        Only the cache is updated here; __flush_counters writes the change to Config later.
+        """
+
+        state = self.__state(guild)
+        dirty = self.__dirty_counters[guild.id]
+
+        if state["date"] != self.__date:
+            # first event in this guild since the day rolled over
+            state["date"] = self.__date
+            dirty.add("date")
+            for e in EVENTS:
+                state[e]["counter"] = 0
+                dirty.add(e)
 
-        role_str: str = ""
-        if isinstance(user, discord.Member):
-            roles = [r.name for r in user.roles if r.name != "@everyone"]
-            if len(roles) > 0:
-                role_str = humanize_list(roles)
+        state[event]["counter"] += 1
+        dirty.add(event)
+
+        self.__history(guild.id).record(event, self.__date)
+        dirty.add("history")
+
+    def __history(self, guild_id: int) -> EventHistory:
+        """Gets the event history for the guild with the given ID."""
 
         try:
-            return await channel.send(
-                format_str.format(
-                    member=SafeMember(user),
-                    server=SafeGuild(guild),
-                    bot=SafeMember(user),
-                    count=count or "",
-                    plural=plural,
-                    roles=role_str,
-                )
-            )
-        except discord.Forbidden:
-            log.error(
-                f"Failed to send {event} message to channel ID {channel.id} (server ID {guild.id}): "
-                "insufficient permissions"
-            )
-            return None
-        except discord.DiscordException:
-            log.error(f"Failed to send {event} message to channel ID {channel.id} (server ID {guild.id})")
-            return None
+            return self.__histories[guild_id]
+        except KeyError:
+            data = self.__states.get(guild_id, {}).get("history")
+            return self.__histories.setdefault(guild_id, EventHistory.from_data(EVENTS, data))
 
-    async def __get_random_message_format(self, guild: discord.guild, event: str) -> str:
-        """Gets a random message for event of type event."""
+    async def __flush_counters(self) -> None:
+        """Writes the state of every guild whose counters (or date) changed since the last flush to Config.
 
-        async with self.config.guild(guild).get_attr(event).messages() as messages:
-            return random.choice(messages)
+        Each guild's state is written whole, in a single write, however many of its counters changed.
+        """
 
-    async def __increment_count(self, guild: discord.Guild, event: str) -> None:
-        """Increments the counter for <event>s today. Handles date changes."""
+        dirty_counters, self.__dirty_counters = self.__dirty_counters, defaultdict(set)
 
-        guild_settings = self.config.guild(guild)
+        for guild_id, keys in dirty_counters.items():
+            state = self.__states[guild_id]
+            if "history" in keys:
+                state["history"] = self.__histories[guild_id].to_data()
 
-        if await guild_settings.date() is None:
-            await guild_settings.date.set(Welcome.__today())
+            try:
+                await self.config.custom("STATE", guild_id).set(state)
+            except Exception:
+                log.exception(f"Failed to save counters (server ID {guild_id})")
+                # try again on the next flush
+                self.__dirty_counters[guild_id].update(keys)
+
+    async def __flush_counters_periodically(self) -> None:
+        """Flushes the buffered counters every counter_flush_interval seconds, forever."""
+
+        while True:
+            await asyncio.sleep(self.counter_flush_interval)
+            await self.__flush_counters()
+
+    async def __roll_over_daily(self) -> None:
+        """Moves the current date forward at each midnight, forever.
+
+        Each guild's counters are reset by __increment_count the first time it sees the new date.
+        """
+
+        while True:
+            tomorrow = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=1), datetime.time())
+            await asyncio.sleep(max((tomorrow - datetime.datetime.now()).total_seconds(), 1))
+            self.__date = Welcome.__today()
+
+    def __queue_whisper(self, member: discord.Member, *, fallback: bool) -> None:
+        """Queues a whisper to member; if fallback is set, a notice is sent in its place should it fail."""
+
+        try:
+            self.__whispers.put_nowait((member, fallback))
+        except asyncio.QueueFull:
+            log.warning(f"Failed to queue DM to member ID {member.id} (server ID {member.guild.id}): queue is full")
+            if fallback:
+                self.__queue_whisper_fallback(member)
 
-        if Welcome.__today() > await guild_settings.date():
-            await guild_settings.date.set(Welcome.__today())
-            await guild_settings.get_attr(event).counter.set(0)
+    def __queue_whisper_fallback(self, member: discord.Member) -> None:
+        """Queues a join notice, using the whisper message, in place of a whisper which could not be sent."""
 
-        count: int = await guild_settings.get_attr(event).counter()
-        await guild_settings.get_attr(event).counter.set(count + 1)
+        message_format = self.__settings(member.guild)["join"]["whisper"]["message"]
+        handler = functools.partial(self.__handle_event, message_format=message_format)
+        self.__enqueue(member.guild, handler, member.guild, member, "join")
+
+    async def __send_whispers(self) -> None:
+        """Sends queued whispers, one at a time, forever. Several of these run at once."""
+
+        while True:
+            member, fallback = await self.__whispers.get()
+            try:
+                if not await self.__try_whisper(member) and fallback:
+                    self.__queue_whisper_fallback(member)
+            except Exception:
+                log.exception(f"Failed to send DM to member ID {member.id} (server ID {member.guild.id})")
+            finally:
+                self.__whispers.task_done()
+
+    async def __try_whisper(self, member: discord.Member) -> bool:
+        """Sends a whisper to member, backing off and retrying if rate limited. Indicates whether it was sent."""
+
+        for attempt in range(self.whisper_attempts):
+            delay = self.__whispers_paused_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                await self.__dm_user(member)
+            except WhisperRateLimitError:
+                # pause every whisper, not just this one
+                pause = self.whisper_backoff * 2**attempt
+                self.__whispers_paused_until = max(self.__whispers_paused_until, time.monotonic() + pause)
+            except WhisperError:
+                return False
+            else:
+                return True
+
+        return False
 
     async def __dm_user(self, member: discord.Member) -> None:
         """Sends a DM to the user with a filled-in message_format."""
 
-        message_format = await self.config.guild(member.guild).join.whisper.message()
+        message_format = self.__settings(member.guild)["join"]["whisper"]["message"]
+
+        try:
+            # whispers have always been filled in from the member and server themselves, not their safe models
+            content = compile_template(message_format, WHISPER_FIELDS).render(
+                {"member": lambda: member, "server": lambda: member.guild}
+            )
+        except (TemplateError, AttributeError, IndexError, KeyError, TypeError, ValueError):
+            log.error(f"Failed to fill in whisper message format (server ID {member.guild.id})")
+            raise WhisperError()
 
         try:
-            await member.send(message_format.format(member=member, server=member.guild))
+            await member.send(content)
         except discord.Forbidden:
             log.error(
                 f"Failed to send DM to member ID {member.id} (server ID {member.guild.id}): insufficient permissions"
             )
             raise WhisperError()
+        except discord.HTTPException as e:
+            if e.status == 429 or e.code == 40003:
+                # 40003 is "opening direct messages too fast"
+                log.warning(f"Failed to send DM to member ID {member.id} (server ID {member.guild.id}): rate limited")
+                raise WhisperRateLimitError()
+
+            log.error(f"Failed to send DM to member ID {member.id} (server ID {member.guild.id})")
+            raise WhisperError()
         except discord.DiscordException:
             log.error(f"Failed to send DM to member ID {member.id} (server ID {member.guild.id})")
             raise WhisperError()
 
+    def __settings(self, guild: discord.Guild) -> Dict[str, Any]:
+        """Gets the cached settings for guild, starting from the defaults if it has none yet."""
+
+        try:
+            return self.__cache[guild.id]
+        except KeyError:
+            return self.__cache.setdefault(guild.id, copy.deepcopy(self.guild_defaults))
+
+    async def __set(self, guild: discord.Guild, *path: str, value: Any) -> None:
+        """Sets the setting at path for guild, writing through to both Config and the cache."""
+
+        await self.config.guild(guild).set_raw(*path, value=value)
+
+        node = self.__settings(guild)
+        for key in path[:-1]:
+            node = node[key]
+        node[path[-1]] = value
+
+        if path[-1] == "channel":
+            self.__channels.pop(guild.id, None)
+        elif path[-1] in ("messages", "order"):
+            self.__pools.pop((guild.id, path[0]), None)
+
+    def __trace_dir(self) -> Path:
+        """Gets the directory in which traces are saved."""
+
+        return cog_data_path(self) / "traces"
+
+    def __state(self, guild: discord.Guild) -> Dict[str, Any]:
+        """Gets the cached runtime state for guild, starting from the defaults if it has none yet."""
+
+        try:
+            return self.__states[guild.id]
+        except KeyError:
+            return self.__states.setdefault(guild.id, copy.deepcopy(self.state_defaults))
+
+    async def __set_state(self, guild: discord.Guild, *path: str, value: Any) -> None:
+        """Sets the runtime state at path for guild, writing through to both Config and the cache."""
+
+        await self.config.custom("STATE", guild.id).set_raw(*path, value=value)
+
+        node = self.__state(guild)
+        for key in path[:-1]:
+            node = node[key]
+        node[path[-1]] = value
+
+    async def __migrate_state(self) -> None:
+        """Moves the date, counters, and previous notices out of each guild's settings and into its state.
+
+        Before schema version 2 these lived in the guild settings, so every event rewrote the whole settings document.
+        """
+
+        for guild_id, data in (await self.config.all_guilds()).items():
+            guild_settings = self.config.guild_from_id(guild_id)
+            state = copy.deepcopy(self.state_defaults)
+            state["date"] = data.get("date")
+            state["history"] = data.get("history") or {}
+
+            for event in EVENTS:
+                old = data.get(event, {})
+                state[event]["counter"] = old.get("counter", 0)
+                state[event]["notices"] = old.get("notices", [])
+                if old.get("last") is not None:
+                    # only the message ID was kept; its channel is worked out when it is deleted
+                    state[event]["notices"].insert(0, [None, old["last"]])
+
+                for key in ("counter", "last", "notices"):
+                    await guild_settings.clear_raw(event, key)
+
+            await guild_settings.clear_raw("date")
+            await guild_settings.clear_raw("history")
+            await self.config.custom("STATE", guild_id).set(state)
+
+        await self.config.schema_version.set(2)
+
     @staticmethod
     async def __get_number_input(ctx: commands.Context, maximum: int, minimum: int = 0) -> int:
         """Gets a number from the user, minimum < x <= maximum."""
@@ -870,6 +2285,49 @@ class Welcome(commands.Cog):
         else:
             return int(msg.content)
 
+    @staticmethod
+    def __role_list(user: Union[discord.Member, discord.User]) -> str:
+        """Gets a human-readable list of user's roles, if it is a member."""
+
+        if not isinstance(user, discord.Member):
+            return ""
+
+        return humanize_list([r.name for r in user.roles if not r.is_default()])
+
+    @staticmethod
+    def __mirror_list(guild: discord.Guild, mirror_ids: List[int], *, mention: bool) -> str:
+        """Gets a readable list of the mirror channels which still exist."""
+
+        mirrors = [c for c in map(guild.get_channel, mirror_ids) if c is not None]
+        if not mirrors:
+            return "None"
+
+        return humanize_list([c.mention if mention else str(c) for c in mirrors])
+
+    @staticmethod
+    def __split_notices(
+        notices: List[List[Optional[int]]], keep: int, channel_ids: Optional[Set[int]] = None
+    ) -> Tuple[List[List[Optional[int]]], List[List[Optional[int]]]]:
+        """Splits notices into those to let go and those to keep: the newest keep in each channel, and only in
+        channel_ids if it is given. Both lists stay oldest first.
+        """
+
+        kept_in: Dict[Optional[int], int] = defaultdict(int)
+        expired: List[List[Optional[int]]] = []
+        remaining: List[List[Optional[int]]] = []
+
+        for notice in reversed(notices):
+            channel_id = notice[0]
+            if kept_in[channel_id] < keep and (channel_ids is None or channel_id in channel_ids):
+                kept_in[channel_id] += 1
+                remaining.append(notice)
+            else:
+                expired.append(notice)
+
+        expired.reverse()
+        remaining.reverse()
+        return expired, remaining
+
     @staticmethod
     def __can_speak_in(channel: discord.TextChannel) -> bool:
         """Indicates whether the bot has permission to speak in channel."""